@@ -1,41 +1,88 @@
 # Main Flask Application - Original 3-Feature Version
 # app.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-import cv2, numpy as np, base64, io, os
-from PIL import Image
+import cv2, base64, hashlib, hmac, os, json, shutil, signal, time, zipfile
+from functools import wraps
 from werkzeug.utils import secure_filename
 
 from services.emotion_detector import EmotionDetector
 from services.finger_counter   import FingerCounter
-from services.object_counter   import ObjectCounter
-from utils.quotes              import get_quote, get_counting_message
+from services.object_counter   import ObjectCounter, METHODS as OBJECT_METHODS
+from services.batch_pipeline   import BatchPipeline
+from services.job_queue        import JobQueue
+from services.video_analyzer   import is_video_name, VIDEO_MODES
+from services.profiles         import ProfileSelector, UnknownProfile, get_profile, PROFILES
+from services.roi              import (InvalidROI, parse_rois, roi_dicts, emotion_in_rois,
+                                       fingers_in_rois, objects_in_rois)
+from services.analysis         import parse_analyzers, finish_sections
+from services.model_registry   import ModelRegistry, UnknownModel
+from services.results_store    import ResultsStore, InvalidQuery, analysis_key
+from utils.admission           import AdmissionController, Overloaded
+from utils.capture             import RequestCapture
+from utils.memory              import MemoryMonitor
+from utils.thread_budget       import (thread_budget, configure_threads,
+                                       applied as thread_budget_applied)
+from utils.annotation          import render_overlays
+from utils.response_format     import (InvalidFormat, parse_fields, parse_format,
+                                       select_fields, encode, wants, HAS_MSGPACK)
+from utils.image_io            import (decode_image, is_image_name, read_zip_member, UploadTooLarge,
+                                       InvalidImage, MAX_IMAGE_SIDE, MAX_IMAGE_PIXELS, MAX_ENCODED_BYTES)
+from utils.uploads             import (SpooledRequest, MemoryAccountant, MemoryBudgetExceeded,
+                                       RAW_IMAGE_TYPES, b64_to_spool, stream_to_spool, MB)
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+app.config['MAX_JSON_LENGTH'] = int(os.environ.get('MAX_JSON_MB', 20)) * MB
+app.config['REQUEST_MEMORY_LIMIT'] = int(os.environ.get('REQUEST_MEMORY_MB', 256)) * MB
 app.config['UPLOAD_FOLDER'] = 'uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('models', exist_ok=True)
 
+# Largest side clients should send; bigger frames cost upload time and get downscaled
+PREFERRED_INPUT_SIDE = int(os.environ.get('PREFERRED_INPUT_SIDE', 1280))
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi', 'mov'}
 
-# Init services
+# Init services (per-worker thread budget first; see utils/thread_budget.py)
 print("🚀 Initializing AI services...")
+configure_threads()
 emotion_detector = EmotionDetector()
-finger_counter   = FingerCounter()
+finger_counter   = FingerCounter(pool_size=int(os.environ.get('FINGER_POOL_SIZE', 0)) or
+                                 thread_budget()['mediapipe'] or os.cpu_count() or 1)
 object_counter   = ObjectCounter()
-
-# Load emotion model
-for name in ['models/emotion_model_best.h5', 'models/emotion_model_final.h5', 'models/emotion_model.h5']:
-    if os.path.exists(name):
-        emotion_detector.load_model(name)
-        print(f"✅ Emotion model loaded: {name}")
-        break
-else:
-    emotion_detector.build_model()
-    print("⚠️  No trained model found. Please train first using train_model.py")
+batch_pipeline   = BatchPipeline(emotion_detector, finger_counter, object_counter)
+job_queue        = JobQueue(app.config['UPLOAD_FOLDER'],
+                            workers=int(os.environ.get('JOB_WORKERS', 2)),
+                            ttl=int(os.environ.get('JOB_TTL', 3600)))
+
+# Load emotion model; later versions are swapped in through /api/models
+model_registry = ModelRegistry(emotion_detector)
+model_registry.load_initial()
+model_registry.start_sync()
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN')
+
+profile_selector  = ProfileSelector()
+admission         = AdmissionController()
+memory_accountant = MemoryAccountant(int(os.environ.get('WORKER_MEMORY_MB', 1024)) * MB)
+
+# Optional traffic capture for replay with loadtest.py
+request_capture = RequestCapture(os.environ['CAPTURE_REQUESTS'],
+                                 sample=float(os.environ.get('CAPTURE_SAMPLE', 1.0))) \
+    if os.environ.get('CAPTURE_REQUESTS') else None
+
+# Memory gauges, sampled per-endpoint allocation deltas and the recycle threshold
+memory_monitor = MemoryMonitor(sample=float(os.environ.get('MEMORY_SAMPLE', 0)),
+                               recycle_mb=int(os.environ.get('RECYCLE_RSS_MB', 0)) or None,
+                               frames=int(os.environ.get('MEMORY_TRACE_FRAMES', 10)),
+                               trace_idle=int(os.environ.get('MEMORY_TRACE_IDLE', 600)))
+MEMORY_DEBUG = os.environ.get('MEMORY_DEBUG') == '1'
+
+# Optional indexed results store; requests opt in with ?store=true
+results_store = ResultsStore(os.environ['RESULTS_DB']) if os.environ.get('RESULTS_DB') else None
 
 print("✅ All services initialized!")
 
@@ -44,28 +91,361 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.before_request
+def mark_request_start():
+    """
+    Arrival time on the monotonic clock. A proxy's X-Request-Start header
+    (seconds, ms or µs since the epoch, optionally prefixed with 't=') moves
+    it back by the time the request spent queued before reaching Flask.
+    """
+    g.request_start = time.monotonic()
+    header = request.headers.get('X-Request-Start', '').replace('t=', '')
+    try:
+        sent = float(header)
+    except ValueError:
+        return
+    sent /= 1e6 if sent > 1e14 else 1e3 if sent > 1e11 else 1
+    g.request_start -= min(max(0.0, time.time() - sent), 60.0)
+
+
+@app.before_request
+def sample_capture():
+    g.capture = (request_capture is not None and request.method == 'POST' and
+                 request.path.startswith('/api/') and request_capture.sampled())
+
+
+@app.after_request
+def record_capture(response):
+    if g.get('capture'):
+        kind, payload = g.get('capture_payload', (None, None))
+        request_capture.record({
+            'method'      : request.method,
+            'path'        : request.path,
+            'query'       : request.query_string.decode(),
+            'content_type': request.mimetype,
+            'payload_kind': kind,
+            'payload'     : payload,
+            'status'      : response.status_code,
+            'latency_ms'  : round(elapsed_ms(), 1),
+        })
+    return response
+
+
+@app.before_request
+def sample_memory():
+    g.mem_token = memory_monitor.begin() if request.path.startswith('/api/') else None
+
+
+@app.after_request
+def record_memory(response):
+    token = g.pop('mem_token', None)
+    if token is not None:
+        memory_monitor.end(request.endpoint or request.path, token)
+    if memory_monitor.check_recycle():
+        gunicorn = request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')
+        response.call_on_close(lambda: recycle_worker(gunicorn))
+    return response
+
+
+def recycle_worker(gunicorn):
+    """
+    RSS crossed RECYCLE_RSS_MB. Under gunicorn a SIGTERM makes the worker
+    finish its requests and exit, and the arbiter starts a fresh one.
+    """
+    rss = memory_monitor.gauges()['rss_mb']
+    if gunicorn:
+        print(f"♻️  Worker {os.getpid()} at {rss} MB RSS, recycling")
+        os.kill(os.getpid(), signal.SIGTERM)
+    else:
+        print(f"⚠️  Worker at {rss} MB RSS is over RECYCLE_RSS_MB; restart it")
+
+
+def capture_payload(kind, stream=None):
+    """Keep a copy of the request image for replay if this request is being captured."""
+    if g.get('capture'):
+        name = request_capture.save_payload(stream) if stream is not None else \
+            request_capture.save_bytes(request.get_data())
+        g.capture_payload = (kind, name)
+    return stream
+
+
+def elapsed_ms():
+    return 1000 * (time.monotonic() - g.request_start)
+
+
+def remaining_ms(from_body=True):
+    """
+    Time left before the request's ?deadline_ms= (or X-Deadline-Ms, or JSON
+    'deadline_ms'), None if unset. The admission gate passes
+    from_body=False so shed requests never cost a body parse.
+    """
+    deadline = (request.args.get('deadline_ms', type=float) or
+                request.headers.get('X-Deadline-Ms', type=float) or
+                (json_options().get('deadline_ms') if from_body else None))
+    return float(deadline) - elapsed_ms() if deadline else None
+
+
+def request_profile(endpoint):
+    """
+    Profile for this request: an explicit ?profile=, otherwise the most
+    accurate one expected to fit the remaining deadline budget,
+    otherwise the default.
+    """
+    name = request.args.get('profile') or json_options().get('profile')
+    if name:
+        return get_profile(name)
+    remaining = remaining_ms()
+    if remaining is not None:
+        return profile_selector.choose(endpoint, remaining)
+    return get_profile()
+
+
+def overloaded_response(e):
+    resp = jsonify({'error': str(e)})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp
+
+
+def gated(endpoint):
+    """
+    Admission control for an expensive endpoint: at most N requests run at
+    once, a bounded number wait, and the rest are shed with 503. Cheap
+    endpoints such as /api/health are never gated.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with admission.gate(endpoint).admit(remaining_ms(from_body=False)):
+                    return fn(*args, **kwargs)
+            except Overloaded as e:
+                return overloaded_response(e)
+        return wrapper
+    return decorator
+
+
+def request_rois(image_shape):
+    """ROIs from repeated ?roi=x,y,w,h params or a JSON 'rois' list of bbox dicts."""
+    return parse_rois(request.args.getlist('roi') or json_options().get('rois'), image_shape)
+
+
+def request_budget():
+    """Memory budget for the current request, released in teardown."""
+    if 'mem_budget' not in g:
+        g.mem_budget = memory_accountant.budget(app.config['REQUEST_MEMORY_LIMIT'])
+    return g.mem_budget
+
+
+@app.teardown_request
+def release_request_budget(exc):
+    budget = g.pop('mem_budget', None)
+    if budget is not None:
+        budget.release()
+
+
 def img_from_request():
-    if 'file' in request.files:
-        arr = np.array(Image.open(request.files['file']))
-        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if arr.ndim == 3 else arr
-    if request.json and 'image' in request.json:
-        b64 = request.json['image']
-        if ',' in b64: b64 = b64.split(',')[1]
-        arr = np.array(Image.open(io.BytesIO(base64.b64decode(b64))))
-        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if arr.ndim == 3 else arr
-    return None
+    """
+    The request image, from (in order of preference) a raw image/jpeg,
+    image/png or application/octet-stream body, a multipart 'file' part,
+    or a JSON {'image': <base64 / data URL>} body.
+    """
+    budget = request_budget()
+    if request.mimetype in RAW_IMAGE_TYPES:
+        # Read the body straight off the socket; nothing is base64-decoded
+        stream = capture_payload('raw', stream_to_spool(request.stream))
+    elif 'file' in request.files:
+        stream = capture_payload('file', request.files['file'].stream)
+    elif request.is_json:
+        data = json_options()
+        if 'image' not in data:
+            return None
+        capture_payload('json')
+        stream = b64_to_spool(data['image'])
+    else:
+        return None
+    if storing_results():
+        g.content_hash = hash_stream(stream)
+    return decode_image(stream, budget)
+
+
+def hash_stream(stream):
+    """sha1 of a seekable stream's remaining bytes; the stream is rewound."""
+    start  = stream.tell()
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: stream.read(256 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+def storing_results():
+    return results_store is not None and (
+        request.args.get('store') == 'true' or bool(json_options().get('store')))
+
+
+def analyze_stored(analyzers, profile, compute, variant=None, cacheable=True, quotes=True):
+    """
+    compute() the raw sections for `analyzers`, or take them from the results
+    store when this exact image was already analyzed the same way with the
+    same emotion model (unless ?refresh=true), then finish them for this
+    response. New results are stored with ?media_id= and ?ts=.
+    """
+    content_hash = g.get('content_hash')
+    if content_hash is None or not cacheable:
+        return finish_sections(compute(), quotes), False
+    key = analysis_key(analyzers, profile['name'], variant, model_registry.active)
+    if request.args.get('refresh') != 'true':
+        stored = results_store.get(content_hash, key)
+        if stored is not None:
+            return finish_sections(stored, quotes), True
+    sections = finish_sections(compute(), quotes=False)
+    results_store.add_many([{
+        'content_hash': content_hash,
+        # The model that actually ran, should it have been swapped meanwhile
+        'analysis'    : analysis_key(analyzers, profile['name'], variant, model_registry.active),
+        'media_id'    : request.args.get('media_id') or json_options().get('media_id'),
+        'ts'          : request.args.get('ts', type=float) or json_options().get('ts'),
+        'source'      : 'api',
+        'results'     : sections,
+    }])
+    return finish_sections(sections, quotes), False
+
+
+def error_response(e):
+    if isinstance(e, (UnknownProfile, InvalidROI, InvalidFormat, InvalidOption, InvalidImage)):
+        return jsonify({'error': str(e)}), 400
+    if isinstance(e, UploadTooLarge):
+        return jsonify({'error': str(e)}), 413
+    if isinstance(e, MemoryBudgetExceeded):
+        return overloaded_response(Overloaded(str(e)))
+    return jsonify({'error': str(e)}), 500
+
+
+@app.errorhandler(UploadTooLarge)
+@app.errorhandler(MemoryBudgetExceeded)
+def body_limit_exceeded(e):
+    # json_options() can raise these from any endpoint
+    return error_response(e)
+
+
+def batch_uploads():
+    return request.files.getlist('files') + request.files.getlist('archive')
+
+
+def zip_member_limit():
+    """Largest archive member accepted, so the images in flight fit one request budget."""
+    return min(MAX_ENCODED_BYTES, app.config['REQUEST_MEMORY_LIMIT'] // batch_pipeline.max_in_flight)
+
+
+def charge_archives():
+    """
+    Charge the request budget for the archive members the batch pipeline
+    holds at once, from the zip directories alone (nothing is unpacked).
+    """
+    declared = 0
+    for f in batch_uploads():
+        if f.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(f.stream) as zf:
+                declared += sum(info.file_size for info in zf.infolist()
+                                if not info.is_dir() and is_image_name(info.filename))
+            f.stream.seek(0)
+    if declared:
+        request_budget().charge(min(declared, batch_pipeline.max_in_flight * zip_member_limit()),
+                                'Archive images')
+
+
+def batch_sources():
+    """Yield (name, read) pairs from multipart 'files' parts or an uploaded zip archive."""
+    limit = zip_member_limit()
+    for f in batch_uploads():
+        if f.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(f.stream) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and is_image_name(info.filename):
+                        yield info.filename, (lambda info=info: read_zip_member(zf, info, limit))
+        else:
+            yield f.filename, f.read
 
 
 def to_b64(image):
-    pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    buf = io.BytesIO()
-    pil.save(buf, format='JPEG')
-    return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode()
+    # Encode straight from BGR; no RGB copy or PIL round trip
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 75])
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf).decode()
+
+
+def json_options():
+    """
+    The JSON body as a dict ({} if there is none). The first call checks
+    MAX_JSON_LENGTH and charges the request budget before parsing.
+    """
+    if not request.is_json:
+        return {}
+    if 'json_body' not in g:
+        size = request.content_length or 0
+        if size > app.config['MAX_JSON_LENGTH']:
+            raise UploadTooLarge(f"JSON body is {size / MB:.1f} MB, use a multipart upload instead")
+        # Raw body plus the parsed string
+        request_budget().charge(2 * size, 'JSON body')
+        data = request.get_json(silent=True)
+        g.json_body = data if isinstance(data, dict) else {}
+    return g.json_body
 
 
 def annotate_flag():
-    return (request.args.get('annotate') == 'true' or
-            (request.json and request.json.get('annotate')))
+    return request.args.get('annotate') == 'true' or bool(json_options().get('annotate'))
+
+
+def response_options():
+    """(fields, format) from ?fields= and ?format= (or JSON); msgpack via Accept header too."""
+    opts   = json_options()
+    fields = parse_fields(request.args.get('fields') or opts.get('fields'))
+    fmt    = request.args.get('format') or opts.get('format')
+    if not fmt and HAS_MSGPACK and 'application/x-msgpack' in request.headers.get('Accept', ''):
+        fmt = 'msgpack'
+    return fields, parse_format(fmt)
+
+
+class InvalidOption(ValueError):
+    """Raised for a malformed request option."""
+
+
+def number_arg(name, type=float, default=None, minimum=None):
+    """
+    Query parameter (or JSON field) `name` converted with `type`. Raises
+    InvalidOption for a malformed or too small value rather than silently
+    using the default.
+    """
+    raw = request.args.get(name)
+    if raw is None:
+        raw = json_options().get(name)
+    if raw is None:
+        return default
+    kind = 'an integer' if type is int else 'a number'
+    try:
+        value = None if isinstance(raw, (bool, list, dict)) else type(raw)
+    except ValueError:
+        value = None
+    if value is None or value != value:   # unparsable or NaN
+        raise InvalidOption(f"{name} must be {kind}")
+    if minimum is not None and value < minimum:
+        raise InvalidOption(f"{name} must be {kind} >= {minimum}")
+    return value
+
+
+def respond(res, fields=None, fmt='json'):
+    body, mimetype = encode(select_fields(res, fields), fmt)
+    return Response(body, mimetype=mimetype)
+
+
+def annotate(img, overlays):
+    """
+    Render all overlays in one pass and encode. Draws on the request image
+    itself (it is not used afterwards), or on a downscaled copy when
+    annotate_width is given.
+    """
+    width = number_arg('annotate_width', int, minimum=1)
+    return to_b64(render_overlays(img, overlays, output_width=width, copy=False))
 
 
 @app.route('/')
@@ -75,10 +455,20 @@ def home():
         'version': '1.0.0',
         'endpoints': [
             'GET  /api/health',
+            'GET  /api/metrics',
             'POST /api/detect-emotion',
             'POST /api/count-fingers',
             'POST /api/count-objects',
             'POST /api/analyze-all',
+            'DELETE /api/streams/<stream_id>',
+            'GET  /api/results',
+            'POST /api/analyze-batch',
+            'POST /api/jobs',
+            'GET  /api/jobs/<job_id>',
+            'GET  /api/models',
+            'POST /api/models/activate',
+            'POST /api/models/candidate',
+            'POST /api/models/promote',
         ]
     })
 
@@ -88,82 +478,432 @@ def health():
     return jsonify({
         'status' : 'healthy',
         'model'  : 'loaded' if emotion_detector.model else 'not loaded',
-        'features': ['emotion', 'fingers', 'objects']
+        'model_version': model_registry.active,
+        'features': ['emotion', 'fingers', 'objects'],
+        'finger_pool': finger_counter.pool_stats(),
+        'profile_latency_ms': profile_selector.stats(),
+        'input': {
+            'preferred_format'  : 'image/jpeg',
+            'preferred_max_side': PREFERRED_INPUT_SIDE,
+            'accepted_types'    : sorted(RAW_IMAGE_TYPES | {'multipart/form-data', 'application/json'}),
+            'max_side'          : MAX_IMAGE_SIDE,
+            'max_pixels'        : MAX_IMAGE_PIXELS,
+            'max_bytes'         : app.config['MAX_CONTENT_LENGTH'],
+            'profile_max_side'  : {name: p['max_side'] for name, p in PROFILES.items()},
+        }
+    })
+
+
+@app.route('/api/metrics')
+def metrics():
+    return jsonify({
+        'admission'         : admission.stats(),
+        'memory'            : memory_accountant.stats(),
+        'finger_pool'       : finger_counter.pool_stats(),
+        'profile_latency_ms': profile_selector.stats(),
+        'capture'           : request_capture.stats() if request_capture else None,
+        'worker_memory'     : memory_monitor.gauges(),
+        'object_streams'    : object_counter.stream_stats(),
+        'models'            : model_registry.stats(),
+        'threads'           : thread_budget_applied(),
+        'results_store'     : results_store.stats() if results_store else None,
     })
 
 
+def model_admin_denied():
+    """Model changes need MODEL_ADMIN_TOKEN to be set and a matching X-Admin-Token."""
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({'error': 'Model changes are disabled; set MODEL_ADMIN_TOKEN'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), MODEL_ADMIN_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+
+@app.route('/api/models')
+def list_models():
+    return jsonify({'versions': model_registry.versions(), **model_registry.stats()})
+
+
+@app.route('/api/models/activate', methods=['POST'])
+def activate_model():
+    """Load {'name': 'emotion_model_v2.h5'} in the background, warm it, then switch to it."""
+    denied = model_admin_denied()
+    if denied: return denied
+    name = json_options().get('name') or request.args.get('name')
+    try:
+        model_registry.activate(name)
+    except UnknownModel as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({'name': name, 'status': 'activating'}), 202
+
+
+@app.route('/api/models/candidate', methods=['POST', 'DELETE'])
+def candidate_model():
+    """Shadow a fraction of traffic to a candidate: {'name': ..., 'shadow_fraction': 0.1}."""
+    denied = model_admin_denied()
+    if denied: return denied
+    if request.method == 'DELETE':
+        model_registry.clear_candidate()
+        return jsonify({'candidate': None})
+    opts = json_options()
+    name = opts.get('name') or request.args.get('name')
+    try:
+        fraction = float(opts.get('shadow_fraction', request.args.get('shadow_fraction', 0.1)))
+        model_registry.set_candidate(name, fraction)
+    except UnknownModel as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError:
+        return jsonify({'error': 'shadow_fraction must be a number between 0 and 1'}), 400
+    return jsonify({'candidate': name, 'shadow_fraction': model_registry.shadow_fraction,
+                    'status': 'loading'}), 202
+
+
+@app.route('/api/models/promote', methods=['POST'])
+def promote_model():
+    """Switch traffic to the loaded candidate."""
+    denied = model_admin_denied()
+    if denied: return denied
+    try:
+        name = model_registry.promote()
+    except UnknownModel as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'active': name})
+
+
+@app.route('/api/debug/memory')
+def debug_memory():
+    """Memory gauges, per-endpoint deltas and kept snapshots (needs MEMORY_DEBUG=1)."""
+    if not MEMORY_DEBUG:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(memory_monitor.stats())
+
+
+@app.route('/api/debug/memory/snapshot', methods=['POST'])
+def debug_memory_snapshot():
+    """Take a tracemalloc snapshot, optionally ?name=; returns its top allocation sites."""
+    if not MEMORY_DEBUG:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(memory_monitor.snapshot(request.args.get('name'),
+                                           request.args.get('limit', 10, type=int)))
+
+
+@app.route('/api/debug/memory/stop', methods=['POST'])
+def debug_memory_stop():
+    """Drop the kept snapshots and stop tracemalloc (kept on while MEMORY_SAMPLE > 0)."""
+    if not MEMORY_DEBUG:
+        return jsonify({'error': 'Not found'}), 404
+    stopped = memory_monitor.stop_tracing()
+    res = {'tracing': not stopped}
+    if not stopped:
+        res['note'] = 'Snapshots dropped; tracing stays on for MEMORY_SAMPLE'
+    return jsonify(res)
+
+
+@app.route('/api/debug/memory/diff')
+def debug_memory_diff():
+    """Top allocation growth between ?from= and ?to= (default: a new snapshot now)."""
+    if not MEMORY_DEBUG:
+        return jsonify({'error': 'Not found'}), 404
+    key = request.args.get('key', 'lineno')
+    if key not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'key must be lineno, filename or traceback'}), 400
+    old = request.args.get('from')
+    if not old:
+        return jsonify({'error': 'from= snapshot name is required'}), 400
+    if not memory_monitor.has_snapshot(old):
+        return jsonify({'error': f"No snapshot named '{old}'"}), 404
+    new = request.args.get('to') or memory_monitor.snapshot(limit=0)['name']
+    try:
+        diff = memory_monitor.diff(old, new, request.args.get('limit', 20, type=int), key)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    return jsonify({'from': old, 'to': new, 'top': diff})
+
+
 @app.route('/api/detect-emotion', methods=['POST'])
+@gated('detect-emotion')
 def detect_emotion():
     try:
         img = img_from_request()
         if img is None: return jsonify({'error': 'No image provided'}), 400
-        res = emotion_detector.predict_emotion(img)
-        for e in res.get('emotions', []):
-            e['quote'] = get_quote(e['emotion'])
-        if annotate_flag():
-            res['annotated_image'] = to_b64(emotion_detector.draw_results(img, res))
-        return jsonify(res)
+        fields, fmt = response_options()
+        profile = request_profile('detect-emotion')
+        rois    = request_rois(img.shape)
+        def compute():
+            with profile_selector.timed('detect-emotion', profile):
+                return {'emotion': emotion_in_rois(emotion_detector, img, rois, profile)}
+        sections, stored = analyze_stored(['emotion'], profile, compute, cacheable=not rois,
+                                          quotes=wants(fields, 'quote'))
+        res = sections['emotion']
+        res['profile'] = profile['name']
+        if stored: res['stored'] = True
+        if rois: res['rois'] = roi_dicts(rois)
+        if annotate_flag() and wants(fields, 'annotated_image'):
+            res['annotated_image'] = annotate(img, emotion_detector.overlays(res, img.shape))
+        return respond(res, fields, fmt)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/api/count-fingers', methods=['POST'])
+@gated('count-fingers')
 def count_fingers():
     try:
         img = img_from_request()
         if img is None: return jsonify({'error': 'No image provided'}), 400
-        res = finger_counter.count_fingers(img)
-        res['message'] = get_counting_message(res['total_fingers'], 'fingers')
-        if annotate_flag():
-            res['annotated_image'] = to_b64(finger_counter.draw_results(img, res))
-        return jsonify(res)
+        fields, fmt = response_options()
+        profile = request_profile('count-fingers')
+        rois    = request_rois(img.shape)
+        def compute():
+            with profile_selector.timed('count-fingers', profile):
+                return {'fingers': fingers_in_rois(finger_counter, img, rois, profile)}
+        sections, stored = analyze_stored(['fingers'], profile, compute, cacheable=not rois)
+        res = sections['fingers']
+        res['profile'] = profile['name']
+        if stored: res['stored'] = True
+        if rois: res['rois'] = roi_dicts(rois)
+        if annotate_flag() and wants(fields, 'annotated_image'):
+            res['annotated_image'] = annotate(img, finger_counter.overlays(res, img.shape))
+        return respond(res, fields, fmt)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/api/count-objects', methods=['POST'])
+@gated('count-objects')
 def count_objects():
+    """
+    ?method=contour|blob|motion. Motion mode keeps a background model per
+    ?stream=<id>, so send the frames of one fixed camera with the same id.
+    """
     try:
         img = img_from_request()
         if img is None: return jsonify({'error': 'No image provided'}), 400
-        res = object_counter.count_objects(img)
-        res['message'] = get_counting_message(res['count'], 'objects')
-        for o in res.get('objects', []):
-            o.pop('contour', None)
-        if annotate_flag():
-            res['annotated_image'] = to_b64(object_counter.draw_results(img, res))
-        return jsonify(res)
+
+        method = request.args.get('method') or json_options().get('method') or 'contour'
+        stream = request.args.get('stream') or json_options().get('stream')
+        if method not in OBJECT_METHODS:
+            return jsonify({'error': f"method must be one of: {', '.join(OBJECT_METHODS)}"}), 400
+        if method == 'motion' and not stream:
+            return jsonify({'error': 'stream= is required for method=motion'}), 400
+        fields, fmt = response_options()
+        profile = request_profile('count-objects')
+        rois    = request_rois(img.shape)
+        if rois and method == 'motion':
+            return jsonify({'error': 'Regions of interest are not supported with method=motion'}), 400
+        def compute():
+            with profile_selector.timed('count-objects', profile):
+                if method == 'motion':
+                    return {'objects': object_counter.count_objects(img, method, profile, stream)}
+                return {'objects': objects_in_rois(object_counter, img, rois, profile, method)}
+        # Motion results depend on the stream's earlier frames, so never reuse them
+        sections, stored = analyze_stored(['objects'], profile, compute, variant=method,
+                                          cacheable=not rois and method != 'motion')
+        res = sections['objects']
+        res['profile'] = profile['name']
+        if stored: res['stored'] = True
+        if rois: res['rois'] = roi_dicts(rois)
+        if annotate_flag() and wants(fields, 'annotated_image'):
+            res['annotated_image'] = annotate(img, object_counter.overlays(res, img.shape))
+        return respond(res, fields, fmt)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+
+@app.route('/api/results')
+def query_results():
+    """
+    Query stored results, e.g. ?emotion=angry&min_probability=60&min_emotion_faces=3
+    or ?min_objects=20. Needs RESULTS_DB.
+    """
+    if results_store is None:
+        return jsonify({'error': 'Results store is not enabled (set RESULTS_DB)'}), 404
+    args = request.args
+    try:
+        rows = results_store.query(
+            emotion=args.get('emotion'),
+            min_probability=args.get('min_probability', type=float),
+            min_emotion_faces=args.get('min_emotion_faces', 1, type=int),
+            min_faces=args.get('min_faces', type=int),
+            max_faces=args.get('max_faces', type=int),
+            min_hands=args.get('min_hands', type=int),
+            min_fingers=args.get('min_fingers', type=int),
+            min_objects=args.get('min_objects', type=int),
+            max_objects=args.get('max_objects', type=int),
+            media_id=args.get('media_id'),
+            since=args.get('since', type=float),
+            until=args.get('until', type=float),
+            include_result=args.get('include') == 'result',
+            limit=args.get('limit', 100, type=int),
+            offset=args.get('offset', 0, type=int),
+        )
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'count': len(rows), 'results': rows})
+
+
+@app.route('/api/streams/<stream_id>', methods=['DELETE'])
+def reset_stream(stream_id):
+    """Forget a motion stream's background model and tracks (e.g. after the camera moved)."""
+    if not object_counter.reset_stream(stream_id):
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify({'stream': stream_id, 'status': 'reset'})
 
 
 @app.route('/api/analyze-all', methods=['POST'])
+@gated('analyze-all')
 def analyze_all():
     try:
         img = img_from_request()
         if img is None: return jsonify({'error': 'No image provided'}), 400
 
-        em = emotion_detector.predict_emotion(img)
-        for e in em.get('emotions', []): e['quote'] = get_quote(e['emotion'])
+        fields, fmt = response_options()
+        profile = request_profile('analyze-all')
+        rois    = request_rois(img.shape)
+        def compute():
+            with profile_selector.timed('analyze-all', profile):
+                return {
+                    'emotion': emotion_in_rois(emotion_detector, img, rois, profile),
+                    'fingers': fingers_in_rois(finger_counter, img, rois, profile),
+                    'objects': objects_in_rois(object_counter, img, rois, profile),
+                }
+        sections, stored = analyze_stored(['emotion', 'fingers', 'objects'], profile, compute,
+                                          cacheable=not rois, quotes=wants(fields, 'quote'))
+        em, fi, ob = sections['emotion'], sections['fingers'], sections['objects']
+
+        res = {'emotion': em, 'fingers': fi, 'objects': ob, 'profile': profile['name']}
+        if stored: res['stored'] = True
+        if rois: res['rois'] = roi_dicts(rois)
+
+        if annotate_flag() and wants(fields, 'annotated_image'):
+            res['annotated_image'] = annotate(img, emotion_detector.overlays(em, img.shape) +
+                                                   finger_counter.overlays(fi, img.shape) +
+                                                   object_counter.overlays(ob, img.shape))
+
+        return respond(res, fields, fmt)
+    except Exception as e:
+        return error_response(e)
 
-        fi = finger_counter.count_fingers(img)
-        fi['message'] = get_counting_message(fi['total_fingers'], 'fingers')
 
-        ob = object_counter.count_objects(img)
-        ob['message'] = get_counting_message(ob['count'], 'objects')
-        for o in ob.get('objects', []): o.pop('contour', None)
+@app.route('/api/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many images in one request. Send multipart 'files' parts
+    and/or a zip 'archive'; pick analyzers with ?analyzers=emotion,objects.
+    Results stream back as NDJSON, one line per image in completion order.
+    """
+    try:
+        analyzers = parse_analyzers(request.args.get('analyzers') or request.form.get('analyzers'))
+        profile   = get_profile(request.args.get('profile') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not batch_uploads():
+        return jsonify({'error': 'No images provided'}), 400
+    try:
+        charge_archives()
+    except zipfile.BadZipFile as e:
+        return jsonify({'error': f"Invalid archive: {e}"}), 400
+    except (UploadTooLarge, MemoryBudgetExceeded) as e:
+        return error_response(e)
+
+    # The slot is held until the stream is fully sent or the client goes away
+    gate = admission.gate('analyze-batch')
+    try:
+        started = gate.acquire(remaining_ms(from_body=False))
+    except Overloaded as e:
+        return overloaded_response(e)
 
-        res = {'emotion': em, 'fingers': fi, 'objects': ob}
+    def generate():
+        for res in batch_pipeline.run(batch_sources(), analyzers, profile):
+            yield json.dumps(res) + '\n'
 
-        if annotate_flag():
-            ann = emotion_detector.draw_results(img.copy(), em)
-            ann = finger_counter.draw_results(ann, fi)
-            ann = object_counter.draw_results(ann, ob)
-            res['annotated_image'] = to_b64(ann)
+    resp = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    resp.call_on_close(lambda: gate.release(started))
+    return resp
 
-        return jsonify(res)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an analysis and return a job id right away. Accepts the same
+    inputs as the other endpoints plus zip archives and videos.
+    """
+    try:
+        analyzers = parse_analyzers(request.args.get('analyzers') or request.form.get('analyzers'))
+        profile   = get_profile(request.args.get('profile') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job_id, job_dir = job_queue.new_job_dir()
+    try:
+        files = (request.files.getlist('file') + request.files.getlist('files') +
+                 request.files.getlist('archive'))
+        saved = []
+        for i, f in enumerate(files):
+            name = secure_filename(f.filename or '')
+            if not (allowed_file(name) or name.lower().endswith('.zip')):
+                raise ValueError(f"Unsupported file type: {f.filename}")
+            path = os.path.join(job_dir, f"{i:05d}_{name}")
+            f.save(path)
+            saved.append(name)
+
+        if not saved and request.mimetype in RAW_IMAGE_TYPES:
+            with open(os.path.join(job_dir, '00000_image'), 'wb') as f:
+                shutil.copyfileobj(request.stream, f)
+            saved.append('image')
+
+        if not saved and 'image' in json_options():
+            with open(os.path.join(job_dir, '00000_image'), 'wb') as f:
+                shutil.copyfileobj(b64_to_spool(json_options()['image']), f)
+            saved.append('image')
+
+        if not saved:
+            raise ValueError('No image provided')
+    except (UploadTooLarge, MemoryBudgetExceeded) as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return error_response(e)
+    except ValueError as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+
+    options = {'profile': profile['name']}
+    if len(saved) == 1 and is_video_name(saved[0]):
+        kind = 'video'
+        options['mode'] = request.args.get('video_mode', 'stride')
+        if options['mode'] not in VIDEO_MODES:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return jsonify({'error': f"video_mode must be one of: {', '.join(VIDEO_MODES)}"}), 400
+        try:
+            if options['mode'] == 'stride':
+                options['stride'] = number_arg('stride', int, 30, minimum=1)
+            else:
+                for key in ('min_gap', 'max_gap', 'scene_threshold', 'motion_threshold'):
+                    if key in request.args:
+                        options[key] = number_arg(key, float, minimum=0)
+        except ValueError as e:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return jsonify({'error': str(e)}), 400
+    elif len(saved) == 1 and not saved[0].lower().endswith('.zip'):
+        kind = 'image'
+        options['rois'] = request.args.getlist('roi') or json_options().get('rois')
+    else:
+        kind = 'batch'
+
+    job_queue.submit(job_id, job_dir, kind, analyzers, options)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'kind': kind}), 202
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a job. Pass ?wait=<seconds> (max 60) to long-poll until it finishes."""
+    try:
+        wait = min(float(request.args.get('wait', 0)), 60)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    job  = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 
 if __name__ == '__main__':
@@ -172,9 +912,19 @@ if __name__ == '__main__':
     print("=" * 60)
     print("Endpoints:")
     print("  GET  /api/health")
+    print("  GET  /api/metrics")
     print("  POST /api/detect-emotion")
     print("  POST /api/count-fingers")
     print("  POST /api/count-objects")
     print("  POST /api/analyze-all")
+    print("  DELETE /api/streams/<stream_id>")
+    print("  GET  /api/results")
+    print("  POST /api/analyze-batch")
+    print("  POST /api/jobs")
+    print("  GET  /api/jobs/<job_id>")
+    print("  GET  /api/models")
+    print("  POST /api/models/activate")
+    print("  POST /api/models/candidate")
+    print("  POST /api/models/promote")
     print("=" * 60)
     app.run(debug=True, host='0.0.0.0', port=5000)
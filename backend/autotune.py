@@ -0,0 +1,102 @@
+# Thread Budget Autotune Script
+# autotune.py
+
+"""
+Find the gunicorn worker count and per-worker thread budget that give the
+highest throughput on this host while keeping p99 latency under a target.
+
+Each combination starts the API with `gunicorn -w W` and
+THREADS_PER_WORKER=T (see utils/thread_budget.py), drives it with the
+loadtest.py traffic mix at a few client concurrencies, and keeps its best
+step that meets the p99 target with under 1% errors.
+
+Example:
+    python autotune.py --images ../data/test --target-p99 500
+    python autotune.py --images ../data/test --workers 1,2,4 --threads 1,2,4 --duration 20
+"""
+
+import argparse
+import json
+import os
+
+from loadtest import (DEFAULT_MIX, SERVER_CMD, load_images, parse_mix, synth_requests,
+                      run_load, start_server, stop_server)
+
+
+def grid(cores, workers=None, threads=None):
+    """(workers, threads) pairs; by default threads are 1, 2 and an even split of the cores."""
+    workers = workers or [w for w in (1, 2, 4, 8, 16) if w <= cores] or [1]
+    return [(w, t) for w in workers for t in (threads or sorted({1, 2, max(1, cores // w)}))]
+
+
+def tune(args):
+    images = load_images(args.images)
+    mix    = parse_mix(args.mix)
+    cores  = os.cpu_count() or 1
+    combos = grid(cores,
+                  [int(w) for w in args.workers.split(',')] if args.workers else None,
+                  [int(t) for t in args.threads.split(',')] if args.threads else None)
+
+    print(f"🔧 {cores} cores, {len(combos)} combinations, target p99 {args.target_p99:.0f} ms")
+    port    = args.url.rsplit(':', 1)[-1].strip('/')
+    results = []
+    for workers, threads in combos:
+        env    = {'THREADS_PER_WORKER': str(threads), 'WEB_CONCURRENCY': str(workers)}
+        server = start_server(SERVER_CMD.format(workers=workers, port=port), args.url, env=env)
+        best   = None
+        try:
+            # Warm every worker up before measuring
+            run_load(args.url, synth_requests(images, mix), workers, duration=5)
+            for factor in (1, 2, 4):
+                concurrency = workers * factor
+                total = run_load(args.url, synth_requests(images, mix, seed=concurrency),
+                                 concurrency, duration=args.duration)['total']
+                ok = total['error_rate'] <= 0.01 and total['p99_ms'] is not None \
+                    and total['p99_ms'] <= args.target_p99
+                print(f"  -w {workers} threads {threads} clients {concurrency}: "
+                      f"{total['throughput']:.1f} rps, p99 {total['p99_ms']} ms"
+                      f"{'' if ok else '  ✗'}")
+                if ok and (best is None or total['throughput'] > best['throughput']):
+                    best = {**total, 'clients': concurrency}
+        finally:
+            stop_server(server)
+        results.append({'workers': workers, 'threads': threads, 'best': best})
+
+    passing = [r for r in results if r['best']]
+    print("\n📊 Best step per combination:")
+    for r in results:
+        b = r['best']
+        print(f"  workers={r['workers']:<3} threads={r['threads']:<3} " +
+              ("no step met the target" if b is None else
+               f"{b['throughput']:.1f} rps  p99 {b['p99_ms']} ms  ({b['clients']} clients)"))
+
+    if passing:
+        pick = max(passing, key=lambda r: r['best']['throughput'])
+        print(f"\n✅ Recommended: gunicorn -w {pick['workers']} with THREADS_PER_WORKER={pick['threads']}"
+              f" ({pick['best']['throughput']:.1f} rps at p99 {pick['best']['p99_ms']} ms)")
+    else:
+        pick = None
+        print("\n⚠️  No combination met the p99 target; try a higher --target-p99 or the fast profile")
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'cores': cores, 'target_p99_ms': args.target_p99,
+                       'results': results, 'recommended': pick}, f, indent=2)
+    return pick
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--images', required=True, help='directory of images for the traffic mix')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--target-p99', type=float, default=500.0, help='p99 latency target in ms')
+    parser.add_argument('--workers', default=None, help='worker counts to try, e.g. 1,2,4')
+    parser.add_argument('--threads', default=None, help='threads per worker to try, e.g. 1,2,4')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per load step')
+    parser.add_argument('--url', default='http://127.0.0.1:5055')
+    parser.add_argument('--json-out', default=None)
+    tune(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+# Offline Bulk Processing Script
+# batch_process.py
+
+"""
+Analyze whole directory trees of images and videos without going through
+the Flask API.
+
+Files are handed to a pool of worker processes in chunks; every worker
+loads the models once, and face crops from a whole chunk go through the
+emotion model in one call. Results are written incrementally and every
+finished file is recorded in a checkpoint, so an interrupted run can be
+restarted with the same command and skips what is already done.
+
+With --store, results are also indexed in a SQLite results store (see
+services/results_store.py) and files whose content was already analyzed
+the same way are skipped, even under another name.
+
+Examples:
+    python batch_process.py /archive/frames --out results.jsonl
+    python batch_process.py /archive/frames --out results.jsonl --store results.db
+    python batch_process.py /archive --out results_parquet --format parquet \\
+        --workers 8 --analyzers emotion,objects --profile balanced
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+
+from services.analysis import parse_analyzers
+from services.profiles import get_profile
+from services.video_analyzer import is_video_name
+from utils.image_io import is_image_name
+
+STAGES = ('decode', 'emotion', 'fingers', 'objects', 'video')
+
+# Per-process state, filled in by _init_worker
+_worker = {}
+
+
+def _init_worker(analyzers, profile, video_options, threads, store_path):
+    from services.analysis import load_services, follow_models
+    from services.results_store import ResultsStore
+
+    # Split the cores between the workers unless a budget is configured
+    os.environ.setdefault('THREADS_PER_WORKER', str(threads))
+    _worker['services']      = load_services(emotion_model=False)
+    _worker['models']        = follow_models(_worker['services'][0])
+    _worker['analyzers']     = analyzers
+    _worker['profile']       = profile
+    _worker['video_options'] = video_options
+    _worker['store']         = ResultsStore(store_path) if store_path else None
+    _worker['profile_name']  = get_profile(profile)['name']
+
+
+def _hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _process_chunk(root, rel_paths):
+    """Analyze one chunk of files; returns (records, stage_seconds)."""
+    from services.analysis import finish_emotion, finish_fingers, finish_objects
+    from services.video_analyzer import VideoAnalyzer, video_variant
+    from services.results_store import analysis_key
+    from utils.image_io import decode_image
+
+    emotion_detector, finger_counter, object_counter = _worker['services']
+    analyzers = _worker['analyzers']
+    profile   = _worker['profile']
+    store     = _worker['store']
+    timings   = defaultdict(float)
+    records   = []
+    images    = []   # (record, image)
+
+    # Pick up a model swapped in through the API; the whole chunk uses one version
+    models = _worker['models']
+    models.sync(wait=True)
+    analysis = analysis_key(analyzers, _worker['profile_name'], model=models.active)
+    video_analysis = analysis_key(analyzers, _worker['profile_name'],
+                                  video_variant(_worker['video_options']), models.active)
+    # Results are stored without quotes, like the images below
+    videos = VideoAnalyzer(*_worker['services'], quotes=False)
+
+    def timed(stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[stage] += time.perf_counter() - start
+
+    for rel in rel_paths:
+        path   = os.path.join(root, rel)
+        record = {'path': rel}
+        if 'emotion' in analyzers:
+            record['model'] = models.active
+        records.append(record)
+        try:
+            if is_video_name(rel):
+                record['kind'] = 'video'
+                if store is not None:
+                    record['content_hash'] = _hash_file(path)
+                    frames = store.frames(record['content_hash'], video_analysis)
+                    if frames:
+                        record['video'] = {'mode': 'stored', 'frames_analyzed': len(frames),
+                                           'frames': frames}
+                        record['stored'] = True
+                        continue
+                record['video'] = timed('video', videos.analyze,
+                                        path, analyzers, profile=profile, **_worker['video_options'])
+            else:
+                record['kind'] = 'image'
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if store is not None:
+                    record['content_hash'] = hashlib.sha1(data).hexdigest()
+                    stored = store.get(record['content_hash'], analysis)
+                    if stored is not None:
+                        record.update(stored, stored=True)
+                        continue
+                images.append((record, timed('decode', decode_image, data)))
+        except Exception as e:
+            record['error'] = str(e)
+
+    if images and 'emotion' in analyzers:
+        try:
+            emotions = timed('emotion', emotion_detector.predict_emotions,
+                             [img for _, img in images], profile)
+            for (record, _), res in zip(images, emotions):
+                record['emotion'] = finish_emotion(res, quotes=False)
+        except Exception as e:
+            for record, _ in images:
+                record['error'] = str(e)
+
+    for record, img in images:
+        try:
+            if 'fingers' in analyzers:
+                record['fingers'] = finish_fingers(
+                    timed('fingers', finger_counter.count_fingers, img, profile))
+            if 'objects' in analyzers:
+                record['objects'] = finish_objects(
+                    timed('objects', object_counter.count_objects, img, profile=profile))
+        except Exception as e:
+            record['error'] = str(e)
+
+    return records, dict(timings)
+
+
+# ----------------------------------------------------------------------
+def walk_media(root):
+    """Yield media paths under root, relative to it, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if is_image_name(name) or is_video_name(name):
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def store_rows(records, analyzers, profile_name, video_options):
+    """Results-store rows for freshly analyzed records (one per image or video frame)."""
+    from services.results_store import analysis_key
+    from services.video_analyzer import video_variant
+
+    rows = []
+    for r in records:
+        if r.get('stored') or r.get('error') or 'content_hash' not in r:
+            continue
+        variant = video_variant(video_options) if r['kind'] == 'video' else None
+        base = {'analysis': analysis_key(analyzers, profile_name, variant, r.get('model')),
+                'media_id': r['path'], 'source': 'batch'}
+        if r['kind'] == 'image':
+            rows.append({**base, 'content_hash': r['content_hash'],
+                         'results': {k: r[k] for k in ('emotion', 'fingers', 'objects') if k in r}})
+            continue
+        video = r['video']
+        for item in video.get('frames') or video.get('segments', []):
+            frame = item.get('frame', item.get('start_frame'))
+            rows.append({**base, 'content_hash': f"{r['content_hash']}#{frame}", 'frame': frame,
+                         'ts': item.get('time', item.get('start')),
+                         'results': item.get('results') or
+                                    {k: item[k] for k in ('emotion', 'fingers', 'objects') if k in item}})
+    return rows
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+# Writers return the paths whose results are on disk after each call, so
+# only those are checkpointed.
+class JsonlWriter:
+    def __init__(self, path):
+        self.f = open(path, 'a')
+
+    def write(self, records):
+        for r in records:
+            self.f.write(json.dumps(r) + '\n')
+        self.f.flush()
+        return [r['path'] for r in records]
+
+    def close(self):
+        self.f.close()
+        return []
+
+
+class ParquetWriter:
+    """Writes one part file per flush into a directory (needs pandas + pyarrow)."""
+
+    def __init__(self, path, rows_per_part=5000):
+        import pandas  # noqa: F401  (fail early if missing)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("❌ Parquet output needs pyarrow: pip install pyarrow")
+        os.makedirs(path, exist_ok=True)
+        self.path  = path
+        self.rows  = []
+        self.rows_per_part = rows_per_part
+        self.part  = len([n for n in os.listdir(path) if n.endswith('.parquet')])
+
+    def write(self, records):
+        for r in records:
+            em, fi, ob = r.get('emotion') or {}, r.get('fingers') or {}, r.get('objects') or {}
+            self.rows.append({
+                'path'          : r['path'],
+                'kind'          : r.get('kind'),
+                'error'         : r.get('error'),
+                'faces_detected': em.get('faces_detected'),
+                'hands_detected': fi.get('hands_detected'),
+                'total_fingers' : fi.get('total_fingers'),
+                'object_count'  : ob.get('count'),
+                'result'        : json.dumps(r),
+            })
+        return self.flush() if len(self.rows) >= self.rows_per_part else []
+
+    def flush(self):
+        import pandas as pd
+        if not self.rows:
+            return []
+        pd.DataFrame(self.rows).to_parquet(
+            os.path.join(self.path, f"part-{self.part:05d}.parquet"), index=False)
+        written    = [row['path'] for row in self.rows]
+        self.part += 1
+        self.rows  = []
+        return written
+
+    def close(self):
+        return self.flush()
+
+
+# ----------------------------------------------------------------------
+def run(args):
+    analyzers  = parse_analyzers(args.analyzers)
+    checkpoint = args.checkpoint or (args.out.rstrip('/') + '.progress')
+    done       = load_checkpoint(checkpoint)
+    writer     = ParquetWriter(args.out) if args.format == 'parquet' else JsonlWriter(args.out)
+    video_options = {'mode': args.video_mode}
+    store      = None
+    if args.store:
+        from services.results_store import ResultsStore
+        store = ResultsStore(args.store)
+
+    def chunks():
+        chunk = []
+        for rel in walk_media(args.input):
+            if rel in done:
+                continue
+            chunk.append(rel)
+            if len(chunk) >= args.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    print(f"📂 {args.input} → {args.out} ({args.format}), {len(done)} files already done")
+    print(f"👷 {args.workers} workers, chunks of {args.chunk_size}, analyzers: {', '.join(analyzers)}")
+
+    totals   = defaultdict(float)
+    files    = 0
+    start    = time.monotonic()
+    last_log = start
+
+    ctx  = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                               initargs=(analyzers, args.profile, video_options,
+                                         max(1, (os.cpu_count() or 1) // args.workers),
+                                         args.store))
+    pending = set()
+    source  = chunks()
+    progress = open(checkpoint, 'a')
+    completed = False
+
+    def mark_done(paths):
+        # Checkpoint only after the results are written
+        progress.write(''.join(p + '\n' for p in paths))
+        progress.flush()
+
+    try:
+        while True:
+            while len(pending) < 2 * args.workers:
+                chunk = next(source, None)
+                if chunk is None:
+                    break
+                pending.add(pool.submit(_process_chunk, args.input, chunk))
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                records, timings = future.result()
+                written = writer.write(records)
+                if store is not None:
+                    store.add_many(store_rows(records, analyzers, get_profile(args.profile)['name'],
+                                              video_options))
+                mark_done(written)
+                files += len(records)
+                for stage, seconds in timings.items():
+                    totals[stage] += seconds
+
+            now = time.monotonic()
+            if now - last_log >= args.log_every:
+                last_log = now
+                _log_progress(files, now - start, totals)
+        completed = True
+    except KeyboardInterrupt:
+        print("\n⚠️  Interrupted. Re-run the same command to resume.")
+        raise
+    finally:
+        # On any error, drop the queued chunks instead of leaving the workers running
+        pool.shutdown(wait=completed, cancel_futures=not completed)
+        mark_done(writer.close())
+        progress.close()
+
+    _log_progress(files, time.monotonic() - start, totals)
+    print("✅ Done")
+
+
+def _log_progress(files, elapsed, totals):
+    rate   = files / elapsed if elapsed else 0.0
+    stages = '  '.join(f"{s} {1000 * totals[s] / files:.1f}ms"
+                       for s in STAGES if totals.get(s) and files)
+    print(f"⏱️  {files} files in {elapsed:.0f}s ({rate:.1f} files/s)  per file: {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('input', help='directory to scan recursively')
+    parser.add_argument('--out', required=True,
+                        help='JSONL file, or output directory for --format parquet')
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+    parser.add_argument('--analyzers', default='all', help='e.g. emotion,objects (default: all)')
+    parser.add_argument('--profile', default=None, help='fast, balanced or accurate')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=32,
+                        help='files per task; face crops of a chunk are batched together')
+    parser.add_argument('--video-mode', choices=('stride', 'scene'), default='scene')
+    parser.add_argument('--store', default=None,
+                        help='also index results in this SQLite results store and skip known content')
+    parser.add_argument('--checkpoint', default=None,
+                        help='progress file (default: <out>.progress)')
+    parser.add_argument('--log-every', type=float, default=10.0, help='seconds between progress lines')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input):
+        sys.exit(f"❌ Not a directory: {args.input}")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Model Evaluation Script
+# evaluate_model.py
+
+"""
+Evaluate an emotion model on a labeled directory laid out like data/train
+(one sub-folder per emotion). Faces go through the same preprocessing as
+the API, in parallel, and through the model in large batches.
+
+Examples:
+    python evaluate_model.py
+    python evaluate_model.py models/emotion_model_v2.h5 --data data/test --batch-size 1024
+    python evaluate_model.py models/emotion_small.tflite --json-out small.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from services.analysis import find_emotion_model
+from services.emotion_detector import evaluate_emotion_model
+
+
+def print_report(report):
+    labels = report['labels']
+    print(f"\n📊 {report['model']} ({report['backend']})")
+    print(f"   Images   : {report['images']}" +
+          (f" ({report['skipped']} unreadable)" if report['skipped'] else ''))
+    if report['accuracy'] is None:
+        print("   ⚠️  No readable images; nothing was evaluated")
+        return
+    print(f"   Accuracy : {100 * report['accuracy']:.2f}%")
+    print(f"   Speed    : {report['images_per_second'] or 0:.0f} images/s "
+          f"({report['seconds']:.1f}s total, {report['inference_seconds']:.1f}s inference, "
+          f"{report['input_wait_seconds']:.1f}s waiting for input)")
+
+    print(f"\n   {'':<10}{'precision':>10}{'recall':>8}{'support':>9}")
+    for label, c in report['per_class'].items():
+        fmt = lambda v: '-' if v is None else f"{v:.3f}"
+        print(f"   {label:<10}{fmt(c['precision']):>10}{fmt(c['recall']):>8}{c['support']:>9}")
+
+    print("\n   Confusion matrix (rows: true, columns: predicted)")
+    print("   " + ' ' * 10 + ''.join(f"{l[:7]:>8}" for l in labels))
+    for label, row in zip(labels, report['confusion']):
+        print(f"   {label:<10}" + ''.join(f"{n:>8}" for n in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('model', nargs='?', default=None,
+                        help='.h5/.keras/.tflite file (default: the model the app would load)')
+    parser.add_argument('--data', default='data/test',
+                        help='held-out labeled directory (default: data/test, the FER2013 test split)')
+    parser.add_argument('--backend', choices=('keras', 'tflite'), default=None)
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=None, help='preprocessing threads')
+    parser.add_argument('--limit', type=int, default=None, help='evaluate a random subset')
+    parser.add_argument('--json-out', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or find_emotion_model()
+    if model is None or not os.path.exists(model):
+        sys.exit("❌ No model file found. Train one with train_model.py or pass a path.")
+    if not os.path.isdir(args.data):
+        sys.exit(f"❌ Data directory not found: {args.data}\n"
+                 f"   Download the FER2013 test split into data/test (see train_model.py), "
+                 f"or pass --data with a held-out folder laid out like data/train.")
+
+    try:
+        report = evaluate_emotion_model(model, args.data, args.batch_size, args.workers,
+                                        args.backend, args.limit)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json_out}")
+
+
+if __name__ == '__main__':
+    main()
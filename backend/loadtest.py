@@ -0,0 +1,358 @@
+# Load Test & Replay Script
+# loadtest.py
+
+"""
+Drive the API with realistic concurrent traffic and report per-endpoint
+throughput, latency percentiles, error rate and the saturation point.
+
+Traffic is either synthesized from a directory of images and an endpoint
+mix, or replayed from a capture recorded by the server itself
+(start it with CAPTURE_REQUESTS=<dir>, optionally CAPTURE_SAMPLE=0.1).
+
+Without --rate each of the --concurrency clients sends its next request as
+soon as the previous one returns (closed loop). With --rate requests arrive
+on a Poisson schedule regardless of how fast the server answers (open loop),
+and latency includes any time a request waited for a free client.
+Comma separated --concurrency / --rate values are run as a sweep.
+
+Examples:
+    python loadtest.py --images ../data/test --concurrency 1,2,4,8,16
+    python loadtest.py --replay captures/monday --rate 5,10,20 --duration 60
+    python loadtest.py --images ../data/test --start-server --workers 4 \\
+        --mix detect-emotion=3,analyze-all=1 --json-out w4.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from utils.capture import load_capture
+from utils.image_io import is_image_name
+
+ENDPOINTS   = ('detect-emotion', 'count-fingers', 'count-objects', 'analyze-all')
+DEFAULT_MIX = 'detect-emotion=4,count-fingers=2,count-objects=2,analyze-all=1'
+SERVER_CMD  = 'gunicorn -w {workers} -b 127.0.0.1:{port} --timeout 120 app:app'
+
+
+# ----------------------------------------------------------------------
+# Traffic sources
+def parse_mix(spec):
+    mix = {}
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'. Choose from: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def load_images(directory, limit=200):
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, n) for n in filenames if is_image_name(n))
+    random.Random(0).shuffle(paths)
+    images = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    if not images:
+        raise ValueError(f"No images found under {directory}")
+    return images
+
+
+def synth_requests(images, mix, payload_kind='raw', query='', seed=0):
+    """Endless stream of requests drawn from the endpoint mix."""
+    rng       = random.Random(seed)
+    endpoints = list(mix)
+    weights   = [mix[e] for e in endpoints]
+    while True:
+        endpoint = rng.choices(endpoints, weights)[0]
+        yield {
+            'endpoint'    : endpoint,
+            'path'        : f'/api/{endpoint}',
+            'query'       : query,
+            'content_type': 'image/jpeg',
+            'payload_kind': payload_kind,
+            'body'        : rng.choice(images),
+        }
+
+
+def replay_requests(entries, loop=True):
+    """Captured requests in their original order (only those with a payload)."""
+    entries = [e for e in entries if e.get('body') is not None]
+    if not entries:
+        raise ValueError("Capture has no requests with payloads")
+    for e in entries:
+        e['endpoint'] = e['path'].rsplit('/', 1)[-1]
+    return itertools.cycle(entries) if loop else iter(entries)
+
+
+def replay_offsets(entries, speed=1.0):
+    """Original inter-arrival times of a capture, scaled by speed."""
+    times = [e['t'] for e in entries if e.get('body') is not None]
+    return [(t - times[0]) / speed for t in times]
+
+
+# ----------------------------------------------------------------------
+# Sending
+def send(session, base_url, req, timeout):
+    url = base_url + req['path'] + ('?' + req['query'] if req.get('query') else '')
+    kind, body = req.get('payload_kind'), req['body']
+    if kind == 'file':
+        kwargs = {'files': {'file': ('image.jpg', body)}}
+    elif kind == 'json':
+        kwargs = {'data': body, 'headers': {'Content-Type': 'application/json'}}
+    else:
+        kwargs = {'data': body, 'headers': {'Content-Type': req.get('content_type') or 'image/jpeg'}}
+    try:
+        return session.post(url, timeout=timeout, **kwargs).status_code
+    except requests.RequestException:
+        return None    # connection error / timeout
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}   # endpoint -> [(latency_ms, status)]
+        self._lock   = threading.Lock()
+
+    def add(self, endpoint, latency_ms, status):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((latency_ms, status))
+
+
+def run_load(base_url, source, concurrency=4, rate=None, duration=30.0,
+             max_requests=None, timeout=30.0, offsets=None):
+    """
+    Send requests from `source` for `duration` seconds (or `max_requests`)
+    and return summarize()'s report. `rate` switches to Poisson arrivals;
+    `offsets` replays explicit arrival times (seconds from the start).
+    """
+    recorder = Recorder()
+    lock     = threading.Lock()
+    start    = time.monotonic()
+    deadline = start + duration
+    sent     = [0]
+
+    def next_request():
+        with lock:
+            if time.monotonic() >= deadline or (max_requests and sent[0] >= max_requests):
+                return None
+            sent[0] += 1
+            return next(source, None)
+
+    def client(jobs):
+        session = requests.Session()
+        while True:
+            if jobs is None:
+                req, scheduled = next_request(), time.monotonic()
+            else:
+                req, scheduled = jobs.get()
+            if req is None:
+                return
+            status = send(session, base_url, req, timeout)
+            recorder.add(req['endpoint'], 1000 * (time.monotonic() - scheduled), status)
+
+    jobs = None if rate is None and offsets is None else queue.Queue()
+    threads = [threading.Thread(target=client, args=(jobs,), daemon=True)
+               for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+
+    if jobs is not None:
+        # Open loop: arrivals are scheduled independently of the responses
+        rng = random.Random(1)
+        arrivals = iter(offsets) if offsets is not None else \
+            itertools.accumulate(rng.expovariate(rate) for _ in itertools.count())
+        for offset in arrivals:
+            at = start + offset
+            if at >= deadline:
+                break
+            req = next_request()
+            if req is None:
+                break
+            time.sleep(max(0.0, at - time.monotonic()))
+            jobs.put((req, at))
+        for _ in threads:
+            jobs.put((None, None))
+
+    for t in threads:
+        t.join()
+    return summarize(recorder.samples, time.monotonic() - start)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[idx], 1)
+
+
+def summarize(samples, elapsed):
+    report = {}
+    everything = []
+    for endpoint, rows in sorted(samples.items()):
+        everything.extend(rows)
+        report[endpoint] = _summary(rows, elapsed)
+    report['total'] = _summary(everything, elapsed)
+    return report
+
+
+def _summary(rows, elapsed):
+    ok        = sorted(lat for lat, status in rows if status is not None and status < 400)
+    shed      = sum(1 for _, status in rows if status == 503)
+    errors    = len(rows) - len(ok)
+    return {
+        'requests'  : len(rows),
+        'throughput': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+        'shed'      : shed,
+        'p50_ms'    : percentile(ok, 50),
+        'p95_ms'    : percentile(ok, 95),
+        'p99_ms'    : percentile(ok, 99),
+        'max_ms'    : round(ok[-1], 1) if ok else None,
+    }
+
+
+def saturation(steps, max_error_rate=0.01):
+    """
+    Per endpoint, the sweep step with the highest successful throughput
+    while the error rate stays under max_error_rate; adding load past it
+    only adds latency (or errors).
+    """
+    points = {}
+    for endpoint in {e for step in steps for e in step['report']}:
+        best = None
+        for step in steps:
+            r = step['report'].get(endpoint)
+            if r and r['error_rate'] <= max_error_rate and \
+                    (best is None or r['throughput'] > best[1]['throughput']):
+                best = (step['label'], r)
+        points[endpoint] = None if best is None else \
+            {'at': best[0], 'throughput': best[1]['throughput'], 'p99_ms': best[1]['p99_ms']}
+    return points
+
+
+def print_report(label, report):
+    print(f"\n📊 {label}")
+    print(f"  {'endpoint':<16}{'reqs':>7}{'rps':>9}{'err%':>7}{'shed':>6}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, r in report.items():
+        fmt = lambda v: '-' if v is None else f"{v:.0f}"
+        print(f"  {endpoint:<16}{r['requests']:>7}{r['throughput']:>9.1f}"
+              f"{100 * r['error_rate']:>7.1f}{r['shed']:>6}"
+              f"{fmt(r['p50_ms']):>9}{fmt(r['p95_ms']):>9}{fmt(r['p99_ms']):>9}")
+
+
+# ----------------------------------------------------------------------
+def start_server(cmd, base_url, timeout=180, env=None):
+    """Start the API with `cmd` (run from this directory) and wait for /api/health."""
+    print(f"🚀 Starting server: {cmd}")
+    proc = subprocess.Popen(shlex.split(cmd), cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=None if env is None else {**os.environ, **env})
+    until = time.monotonic() + timeout
+    while time.monotonic() < until:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            if requests.get(base_url + '/api/health', timeout=2).ok:
+                print("✅ Server is up")
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy in time")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def _values(spec, cast):
+    return [cast(v) for v in str(spec).split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--images', help='directory of images for synthetic traffic')
+    src.add_argument('--replay', help='capture directory recorded with CAPTURE_REQUESTS')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'endpoint weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--payload', choices=('raw', 'file'), default='raw',
+                        help='send synthetic images as a raw body or a multipart file')
+    parser.add_argument('--query', default='', help="extra query string, e.g. 'profile=fast'")
+    parser.add_argument('--concurrency', default='4', help='clients, or a sweep like 1,2,4,8')
+    parser.add_argument('--rate', default=None, help='arrivals/s (open loop), or a sweep like 5,10,20')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='replay with the captured arrival times, sped up by this factor')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per step')
+    parser.add_argument('--requests', type=int, default=None, help='stop each step after N requests')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--start-server', action='store_true', help='start the API locally first')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for --start-server')
+    parser.add_argument('--server-cmd', default=SERVER_CMD)
+    parser.add_argument('--json-out', help='write the full report here for later comparison')
+    args = parser.parse_args(argv)
+
+    entries = load_capture(args.replay) if args.replay else None
+    images  = load_images(args.images) if args.images else None
+    mix     = parse_mix(args.mix)
+
+    def source():
+        if entries is not None:
+            return replay_requests(entries)
+        return synth_requests(images, mix, args.payload, args.query)
+
+    server = None
+    if args.start_server:
+        port   = args.url.rsplit(':', 1)[-1].strip('/')
+        server = start_server(args.server_cmd.format(workers=args.workers, port=port), args.url)
+
+    steps = []
+    try:
+        rates = _values(args.rate, float) if args.rate else [None]
+        for concurrency, rate in itertools.product(_values(args.concurrency, int), rates):
+            offsets = None
+            label   = f"concurrency={concurrency}" + (f" rate={rate:g}/s" if rate else '')
+            if entries is not None and args.speed:
+                offsets = replay_offsets(entries, args.speed)
+                label  += f" replay x{args.speed:g}"
+            report = run_load(args.url, source(), concurrency, rate, args.duration,
+                              args.requests, args.timeout, offsets)
+            print_report(label, report)
+            steps.append({'label': label, 'concurrency': concurrency, 'rate': rate,
+                          'report': report})
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    points = saturation(steps)
+    if len(steps) > 1:
+        print("\n🎯 Saturation (highest throughput with <1% errors):")
+        for endpoint, p in sorted(points.items()):
+            print(f"  {endpoint:<16}" + ("not reached without errors" if p is None else
+                  f"{p['at']}  {p['throughput']:.1f} rps  p99 {p['p99_ms']} ms"))
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': vars(args), 'steps': steps, 'saturation': points}, f, indent=2)
+        print(f"💾 Report written to {args.json_out}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
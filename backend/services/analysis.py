@@ -0,0 +1,123 @@
+# Shared Analysis Helpers
+# services/analysis.py
+#
+# Turns raw service output into the response shape used by the API,
+# so the Flask routes, the batch pipeline and background workers agree.
+
+import os
+
+from utils.quotes import get_quote, get_counting_message
+
+ANALYZERS = ('emotion', 'fingers', 'objects')
+
+
+def parse_analyzers(value):
+    """Parse a comma separated analyzer list ('all' or empty means every analyzer)."""
+    if not value or value == 'all':
+        return list(ANALYZERS)
+    names = [n.strip() for n in value.split(',') if n.strip()]
+    unknown = [n for n in names if n not in ANALYZERS]
+    if unknown:
+        raise ValueError(f"Unknown analyzer(s): {', '.join(unknown)}")
+    return names
+
+
+def finish_emotion(res, quotes=True):
+    if quotes:
+        for e in res.get('emotions', []):
+            e['quote'] = get_quote(e['emotion'])
+    return res
+
+
+def finish_fingers(res):
+    res['message'] = get_counting_message(res['total_fingers'], 'fingers')
+    return res
+
+
+def finish_objects(res):
+    res['message'] = get_counting_message(res['count'], 'objects')
+    for o in res.get('objects', []):
+        o.pop('contour', None)
+    return res
+
+
+def finish_sections(sections, quotes=True):
+    """finish_* every result in a {'emotion' | 'fingers' | 'objects': raw result} dict."""
+    finish = {'emotion': lambda res: finish_emotion(res, quotes),
+              'fingers': finish_fingers, 'objects': finish_objects}
+    return {name: finish[name](res) for name, res in sections.items()}
+
+
+def run_analyzers(image, analyzers, emotion_detector, finger_counter, object_counter,
+                  profile=None, rois=None, quotes=True):
+    """Run the selected analyzers on one image (or only its ROIs) and return {name: result}."""
+    from services.roi import emotion_in_rois, fingers_in_rois, objects_in_rois
+
+    res = {}
+    if 'emotion' in analyzers:
+        res['emotion'] = finish_emotion(emotion_in_rois(emotion_detector, image, rois, profile),
+                                        quotes)
+    if 'fingers' in analyzers:
+        res['fingers'] = finish_fingers(fingers_in_rois(finger_counter, image, rois, profile))
+    if 'objects' in analyzers:
+        res['objects'] = finish_objects(objects_in_rois(object_counter, image, rois, profile))
+    return res
+
+
+# ----------------------------------------------------------------------
+EMOTION_MODEL_PATHS = [
+    'models/emotion_model_best.h5',
+    'models/emotion_model_final.h5',
+    'models/emotion_model.h5',
+]
+
+
+def find_emotion_model():
+    """The model registry's active version, else the first trained model found."""
+    from services.model_registry import read_registry, MODEL_DIR
+
+    active = read_registry().get('active')
+    for name in ([os.path.join(MODEL_DIR, active)] if active else []) + EMOTION_MODEL_PATHS:
+        if os.path.exists(name):
+            return name
+    return None
+
+
+def load_emotion_model(emotion_detector):
+    """Load find_emotion_model()'s model, or build an untrained one."""
+    name = find_emotion_model()
+    if name:
+        emotion_detector.load_model(name)
+        return name
+    emotion_detector.build_model()
+    print("⚠️  No trained model found. Please train first using train_model.py")
+    return None
+
+
+def load_services(emotion_model=True):
+    """
+    Create the three analysis services, e.g. inside a worker process.
+    With emotion_model=False the caller loads the model (see follow_models).
+    """
+    from services.emotion_detector import EmotionDetector
+    from services.finger_counter   import FingerCounter
+    from services.object_counter   import ObjectCounter
+    from utils.thread_budget       import configure_threads
+
+    configure_threads()
+    emotion_detector = EmotionDetector()
+    if emotion_model:
+        load_emotion_model(emotion_detector)
+    return emotion_detector, FingerCounter(), ObjectCounter()
+
+
+def follow_models(emotion_detector):
+    """
+    Load the active emotion model through a registry that follows later
+    swaps; the worker calls .sync(wait=True) before each unit of work.
+    """
+    from services.model_registry import ModelRegistry
+
+    registry = ModelRegistry(emotion_detector, shadow=False)
+    registry.load_initial()
+    return registry
@@ -0,0 +1,99 @@
+# Batch Analysis Pipeline
+# services/batch_pipeline.py
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from services.analysis import finish_emotion, finish_fingers, finish_objects
+from utils.image_io import decode_image
+
+
+class BatchPipeline:
+    """
+    Bounded decode -> analyze pipeline for many images in one request.
+
+    Images are decoded on a small thread pool while the previous group is
+    being analyzed, and face crops of a whole group go through the emotion
+    model in one call. At most `max_in_flight` images are held in memory,
+    however large the batch is.
+    """
+
+    def __init__(self, emotion_detector, finger_counter, object_counter,
+                 decode_workers=2, group_size=8, max_in_flight=16):
+        self.emotion_detector = emotion_detector
+        self.finger_counter   = finger_counter
+        self.object_counter   = object_counter
+        self.decode_workers   = decode_workers
+        self.group_size       = group_size
+        self.max_in_flight    = max(max_in_flight, group_size)
+
+    # ------------------------------------------------------------------
+    def run(self, sources, analyzers, profile=None):
+        """
+        sources: iterable of (name, read) pairs, read() returning encoded bytes.
+        Yields one result dict per input, tagged with its input index,
+        in completion order.
+        """
+        pool    = ThreadPoolExecutor(self.decode_workers)
+        pending = {}   # future -> (index, name)
+        ready   = []   # (index, name, image)
+        sources = enumerate(sources)
+        exhausted = False
+
+        try:
+            while True:
+                # Keep the decode stage full
+                while not exhausted and len(pending) + len(ready) < self.max_in_flight:
+                    try:
+                        index, (name, read) = next(sources)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    try:
+                        pending[pool.submit(decode_image, read())] = (index, name)
+                    except Exception as e:
+                        yield {'index': index, 'name': name, 'error': str(e)}
+
+                if not pending and not ready:
+                    break
+
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, name = pending.pop(future)
+                        try:
+                            ready.append((index, name, future.result()))
+                        except Exception as e:
+                            yield {'index': index, 'name': name, 'error': f"Could not decode image: {e}"}
+
+                if ready and (len(ready) >= self.group_size or not pending):
+                    group, ready = ready, []
+                    yield from self._analyze(group, analyzers, profile)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    def _analyze(self, group, analyzers, profile=None):
+        images   = [image for _, _, image in group]
+        emotions = None
+        emotion_error = None
+
+        if 'emotion' in analyzers:
+            try:
+                emotions = self.emotion_detector.predict_emotions(images, profile)
+            except Exception as e:
+                emotion_error = str(e)
+
+        for i, (index, name, image) in enumerate(group):
+            res = {'index': index, 'name': name}
+            try:
+                if emotion_error:
+                    raise RuntimeError(emotion_error)
+                if emotions is not None:
+                    res['emotion'] = finish_emotion(emotions[i])
+                if 'fingers' in analyzers:
+                    res['fingers'] = finish_fingers(self.finger_counter.count_fingers(image, profile))
+                if 'objects' in analyzers:
+                    res['objects'] = finish_objects(self.object_counter.count_objects(image, profile=profile))
+            except Exception as e:
+                res['error'] = str(e)
+            yield res
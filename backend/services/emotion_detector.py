@@ -4,11 +4,30 @@
 import cv2
 import numpy as np
 import os
+import time
+
+from services.profiles import get_profile, downscale
+from utils.annotation import render_overlays
+
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+
+
+def preprocess_face(face_image):
+    """Grayscale face crop -> (1, 48, 48, 1) float32 model input"""
+    # Resize to 48x48
+    face_resized = cv2.resize(face_image, (48, 48))
+    # Equalize histogram — matches training preprocessing
+    face_eq = cv2.equalizeHist(face_resized)
+    # Normalize to [0, 1]
+    face_normalized = face_eq.astype(np.float32) / 255.0
+    return face_normalized.reshape(1, 48, 48, 1)
+
 
 class EmotionDetector:
     def __init__(self):
-        self.emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+        self.emotion_labels = list(EMOTION_LABELS)
         self.model = None
+        self.on_predict = None   # callback(model, batch, predictions, ms), e.g. ModelRegistry
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
@@ -61,37 +80,35 @@ class EmotionDetector:
         if self.model:
             self.model.save(model_path)
 
-    def detect_faces(self, image):
+    def detect_faces(self, image, profile=None):
+        """
+        Detect faces on a copy downscaled to the profile's max_side.
+        Boxes are returned in full-resolution coordinates, with the
+        full-resolution gray image for cropping.
+        """
+        profile = get_profile(profile)
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small, scale = downscale(gray, profile['max_side'])
         # Equalize histogram for better detection in different lighting
-        gray_eq = cv2.equalizeHist(gray)
+        gray_eq = cv2.equalizeHist(small)
         faces = self.face_cascade.detectMultiScale(
             gray_eq,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
+            scaleFactor=profile['scale_factor'],
+            minNeighbors=profile['min_neighbors'],
+            minSize=profile['min_face_size']
         )
+        if scale != 1.0 and len(faces):
+            faces = np.round(np.asarray(faces) / scale).astype(int)
         return faces, gray
 
     def preprocess_face(self, face_image):
-        # Resize to 48x48
-        face_resized = cv2.resize(face_image, (48, 48))
-        # Equalize histogram — matches training preprocessing
-        face_eq = cv2.equalizeHist(face_resized)
-        # Normalize to [0, 1]
-        face_normalized = face_eq / 255.0
-        return face_normalized.reshape(1, 48, 48, 1)
-
-    def predict_emotion(self, image):
-        if self.model is None:
-            return {"error": "Model not loaded", "faces_detected": 0, "emotions": []}
-
-        faces, gray = self.detect_faces(image)
+        return preprocess_face(face_image)
 
-        if len(faces) == 0:
-            return {"faces_detected": 0, "emotions": []}
+    def extract_faces(self, image, profile=None):
+        """Detect faces and return them with a (n, 48, 48, 1) batch of preprocessed crops."""
+        faces, gray = self.detect_faces(image, profile)
 
-        results = []
+        crops = []
         for (x, y, w, h) in faces:
             # Add padding around face for better detection
             padding = 10
@@ -99,13 +116,16 @@ class EmotionDetector:
             y1 = max(0, y - padding)
             x2 = min(image.shape[1], x + w + padding)
             y2 = min(image.shape[0], y + h + padding)
+            crops.append(self.preprocess_face(gray[y1:y2, x1:x2]))
 
-            face_roi       = gray[y1:y2, x1:x2]
-            face_processed = self.preprocess_face(face_roi)
-            predictions    = self.model.predict(face_processed, verbose=0)
+        batch = np.concatenate(crops) if crops else np.empty((0, 48, 48, 1), np.float32)
+        return faces, batch
 
-            emotion_idx = np.argmax(predictions[0])
-            confidence  = float(predictions[0][emotion_idx])
+    def _format_results(self, faces, predictions):
+        results = []
+        for (x, y, w, h), probs in zip(faces, predictions):
+            emotion_idx = np.argmax(probs)
+            confidence  = float(probs[emotion_idx])
             emotion     = self.emotion_labels[emotion_idx]
 
             results.append({
@@ -114,18 +134,58 @@ class EmotionDetector:
                 'bbox'             : {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
                 'all_probabilities': {
                     label: round(float(prob) * 100, 2)
-                    for label, prob in zip(self.emotion_labels, predictions[0])
+                    for label, prob in zip(self.emotion_labels, probs)
                 }
             })
 
         return {'faces_detected': len(faces), 'emotions': results}
 
-    def draw_results(self, image, results):
+    def predict_emotion(self, image, profile=None):
+        return self.predict_emotions([image], profile)[0]
+
+    def predict_emotions(self, images, profile=None):
+        """
+        Predict emotions for several images at once.
+        Face crops from all images are stacked into a single model call.
+        """
+        if self.model is None:
+            return [{"error": "Model not loaded", "faces_detected": 0, "emotions": []}
+                    for _ in images]
+
+        extracted = [self.extract_faces(image, profile) for image in images]
+        batches   = [batch for _, batch in extracted if len(batch)]
+
+        if not batches:
+            return [{"faces_detected": 0, "emotions": []} for _ in images]
+
+        # One reference for the whole call, so a hot swap can't split a batch
+        model = self.model
+        batch = np.concatenate(batches).astype(np.float32)
+        start = time.perf_counter()
+        # predict_on_batch skips the data adapter model.predict builds on every
+        # call, which keeps growing memory in long-running workers
+        predictions = np.asarray(model.predict_on_batch(batch))
+        if self.on_predict is not None:
+            self.on_predict(model, batch, predictions, 1000 * (time.perf_counter() - start))
+
+        results, offset = [], 0
+        for faces, batch in extracted:
+            n = len(batch)
+            if n == 0:
+                results.append({"faces_detected": 0, "emotions": []})
+                continue
+            results.append(self._format_results(faces, predictions[offset:offset + n]))
+            offset += n
+
+        return results
+
+    def overlays(self, results, image_shape):
+        """Annotation primitives for utils.annotation.render_overlays."""
+        ops = []
         if results.get('faces_detected', 0) == 0:
-            return image
+            return ops
 
-        image_copy = image.copy()
-        img_h, img_w = image_copy.shape[:2]
+        img_h, img_w = image_shape[:2]
 
         for ed in results['emotions']:
             b = ed['bbox']
@@ -140,25 +200,25 @@ class EmotionDetector:
             x2 = min(img_w, x2)
             y2 = min(img_h, y2)
 
-            # Draw face bounding box
-            cv2.rectangle(image_copy, (x, y), (x2, y2), (0, 255, 0), 2)
+            # Face bounding box
+            ops.append(('rect', (x, y), (x2, y2), (0, 255, 0), 2))
 
-            # Draw corner accents
+            # Corner accents
             corner_len = 16
             thickness  = 3
             color      = (0, 255, 0)
             # Top-left
-            cv2.line(image_copy, (x, y), (x + corner_len, y), color, thickness)
-            cv2.line(image_copy, (x, y), (x, y + corner_len), color, thickness)
+            ops.append(('line', (x, y), (x + corner_len, y), color, thickness))
+            ops.append(('line', (x, y), (x, y + corner_len), color, thickness))
             # Top-right
-            cv2.line(image_copy, (x2, y), (x2 - corner_len, y), color, thickness)
-            cv2.line(image_copy, (x2, y), (x2, y + corner_len), color, thickness)
+            ops.append(('line', (x2, y), (x2 - corner_len, y), color, thickness))
+            ops.append(('line', (x2, y), (x2, y + corner_len), color, thickness))
             # Bottom-left
-            cv2.line(image_copy, (x, y2), (x + corner_len, y2), color, thickness)
-            cv2.line(image_copy, (x, y2), (x, y2 - corner_len), color, thickness)
+            ops.append(('line', (x, y2), (x + corner_len, y2), color, thickness))
+            ops.append(('line', (x, y2), (x, y2 - corner_len), color, thickness))
             # Bottom-right
-            cv2.line(image_copy, (x2, y2), (x2 - corner_len, y2), color, thickness)
-            cv2.line(image_copy, (x2, y2), (x2, y2 - corner_len), color, thickness)
+            ops.append(('line', (x2, y2), (x2 - corner_len, y2), color, thickness))
+            ops.append(('line', (x2, y2), (x2, y2 - corner_len), color, thickness))
 
             # Label text
             label      = f"{ed['emotion'].upper()}  {ed['confidence']}%"
@@ -180,60 +240,53 @@ class EmotionDetector:
             if label_x + text_w > img_w:
                 label_x = max(0, img_w - text_w - 4)
 
-            # Draw filled background rectangle for label
+            # Filled background rectangle for label
             pad = 4
-            cv2.rectangle(
-                image_copy,
-                (label_x - pad, label_y - text_h - pad),
-                (label_x + text_w + pad, label_y + baseline + pad),
-                (0, 0, 0), -1
-            )
-            cv2.rectangle(
-                image_copy,
-                (label_x - pad, label_y - text_h - pad),
-                (label_x + text_w + pad, label_y + baseline + pad),
-                (0, 255, 0), 1
-            )
-
-            # Draw label text
-            cv2.putText(image_copy, label,
-                        (label_x, label_y),
-                        font, font_scale, (0, 255, 0), thickness_txt)
-
-        return image_copy
+            ops.append(('rect',
+                        (label_x - pad, label_y - text_h - pad),
+                        (label_x + text_w + pad, label_y + baseline + pad),
+                        (0, 0, 0), -1))
+            ops.append(('rect',
+                        (label_x - pad, label_y - text_h - pad),
+                        (label_x + text_w + pad, label_y + baseline + pad),
+                        (0, 255, 0), 1))
+
+            # Label text
+            ops.append(('text', label, (label_x, label_y), font_scale, (0, 255, 0), thickness_txt))
+
+        return ops
+
+    def draw_results(self, image, results):
+        if results.get('faces_detected', 0) == 0:
+            return image
+        return render_overlays(image, self.overlays(results, image.shape))
 
 
 # Training function
-def train_emotion_model(train_data_path, epochs=50, batch_size=64, resume_model_path=None):
+def train_emotion_model(train_data_path, epochs=50, batch_size=64, resume_model_path=None,
+                        augment='keras', shuffle_buffer=None, data_threads=None,
+                        data_intra_op=None, profile=False, cache_dir='cache',
+                        cache_copies=8):
+    """
+    Train on data/train-style folders. `augment` is one of AUGMENT_MODES;
+    the data_* and shuffle_buffer options tune the tf.data pipeline (see
+    make_train_dataset). With profile=True every step is timed and each
+    epoch reports input-pipeline wait vs compute (see fit_profiled).
+    """
     import tensorflow as tf
-    from pathlib import Path
     from sklearn.model_selection import train_test_split
 
     print("Loading dataset...")
-    emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-    images, labels = [], []
-
-    for idx, emotion in enumerate(emotion_labels):
-        folder = Path(train_data_path) / emotion
-        if not folder.exists():
-            continue
-        files = list(folder.glob('*.jpg')) + list(folder.glob('*.png')) + list(folder.glob('*.jpeg'))
-        print(f"  {emotion}: {len(files)} images")
-        for img_path in files:
-            img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                continue
-            img = cv2.resize(img, (48, 48))
-            # Apply histogram equalization during training too!
-            img = cv2.equalizeHist(img)
-            images.append(img)
-            labels.append(idx)
-
-    if len(images) == 0:
+    items = list_labeled_images(train_data_path)
+    for idx, emotion in enumerate(EMOTION_LABELS):
+        count = sum(1 for _, label in items if label == idx)
+        if count:
+            print(f"  {emotion}: {count} images")
+
+    # Same preprocessing as the API (resize, histogram equalization, /255)
+    X, labels = load_labeled_faces(items)
+    if len(X) == 0:
         raise ValueError("No images loaded!")
-
-    X = np.array(images, dtype='float32') / 255.0
-    X = X.reshape(-1, 48, 48, 1)
     y = tf.keras.utils.to_categorical(labels, num_classes=7)
 
     print(f"\nTotal: {len(X)} images")
@@ -254,21 +307,9 @@ def train_emotion_model(train_data_path, epochs=50, batch_size=64, resume_model_
         print("\n🆕 Building new model...")
         model = detector.build_model()
 
-    # Augmentation
-    data_augmentation = tf.keras.Sequential([
-        tf.keras.layers.RandomFlip("horizontal"),
-        tf.keras.layers.RandomRotation(0.1),
-        tf.keras.layers.RandomTranslation(0.1, 0.1),
-    ])
-
-    train_ds = (
-        tf.data.Dataset.from_tensor_slices((X_train, y_train))
-        .shuffle(1000)
-        .batch(batch_size)
-        .map(lambda x, y: (data_augmentation(x, training=True), y),
-             num_parallel_calls=tf.data.AUTOTUNE)
-        .prefetch(tf.data.AUTOTUNE)
-    )
+    cache = augmented_cache(X_train, cache_dir, cache_copies) if augment == 'cached' else None
+    train_ds = make_train_dataset(X_train, y_train, batch_size, augment, shuffle_buffer,
+                                  data_threads, data_intra_op, cache=cache)
 
     val_ds = (
         tf.data.Dataset.from_tensor_slices((X_val, y_val))
@@ -291,11 +332,503 @@ def train_emotion_model(train_data_path, epochs=50, batch_size=64, resume_model_
         )
     ]
 
-    history = model.fit(
-        train_ds, epochs=epochs,
-        validation_data=val_ds,
-        callbacks=callbacks, verbose=1
-    )
+    if profile:
+        history, epoch_profiles = fit_profiled(model, train_ds, val_ds, epochs, callbacks)
+        _save_profile('models/training_profile.json', epoch_profiles, augment=augment,
+                      batch_size=batch_size, data_threads=data_threads,
+                      data_intra_op=data_intra_op)
+    else:
+        history = model.fit(
+            train_ds, epochs=epochs,
+            validation_data=val_ds,
+            callbacks=callbacks, verbose=1
+        )
 
     model.save('models/emotion_model_final.h5')
+
+    # Record what these models have seen, for incremental training later
+    manifest = build_manifest(train_data_path)
+    for path in ('models/emotion_model_best.h5', 'models/emotion_model_final.h5'):
+        if os.path.exists(path):
+            write_manifest(path, manifest)
     return history, model
+
+
+def _augmentation():
+    import tensorflow as tf
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal"),
+        tf.keras.layers.RandomRotation(0.1),
+        tf.keras.layers.RandomTranslation(0.1, 0.1),
+    ])
+
+
+# ----------------------------------------------------------------------
+# Training input pipeline
+#
+# Augmentation modes:
+#   keras   the Keras preprocessing layers above, run per batch in tf.data
+#   numpy   augment_faces(): the same transforms as one vectorized NumPy
+#           gather per batch, no TensorFlow ops
+#   cached  a few augmented copies of the training set written once to a
+#           uint8 .npy under cache_dir; each sample draws one of them
+#   none    no augmentation
+AUGMENT_MODES = ('keras', 'numpy', 'cached', 'none')
+
+
+def augment_faces(X, rng, rotation=0.1, translation=0.1, flip=True):
+    """
+    Random horizontal flip, rotation and translation of a (N, 48, 48, 1)
+    batch in one bilinear gather. Factors mean the same as in the Keras
+    layers (rotation as a fraction of a full turn); edge pixels are repeated.
+    """
+    n, h, w = X.shape[:3]
+    angle = rng.uniform(-rotation, rotation, n) * 2 * np.pi
+    dx    = rng.uniform(-translation, translation, n) * w
+    dy    = rng.uniform(-translation, translation, n) * h
+    sign  = np.where(rng.random(n) < 0.5, -1.0, 1.0) if flip else np.ones(n)
+
+    # For every output pixel, the input position it samples (inverse transform)
+    cy, cx = (h - 1) / 2, (w - 1) / 2
+    ys, xs = np.mgrid[0:h, 0:w]
+    u = (xs - cx)[None] - dx[:, None, None]
+    v = (ys - cy)[None] - dy[:, None, None]
+    cos, sin = np.cos(angle)[:, None, None], np.sin(angle)[:, None, None]
+    src_x = sign[:, None, None] * (cos * u + sin * v) + cx
+    src_y = (-sin * u + cos * v) + cy
+
+    x0, y0 = np.floor(src_x), np.floor(src_y)
+    wx, wy = (src_x - x0)[..., None], (src_y - y0)[..., None]
+    x0, x1 = np.clip(x0, 0, w - 1).astype(np.intp), np.clip(x0 + 1, 0, w - 1).astype(np.intp)
+    y0, y1 = np.clip(y0, 0, h - 1).astype(np.intp), np.clip(y0 + 1, 0, h - 1).astype(np.intp)
+    b = np.arange(n)[:, None, None]
+
+    top = X[b, y0, x0] * (1 - wx) + X[b, y0, x1] * wx
+    bot = X[b, y1, x0] * (1 - wx) + X[b, y1, x1] * wx
+    return (top * (1 - wy) + bot * wy).astype(np.float32)
+
+
+def augmented_cache(X, cache_dir='cache', copies=8, seed=42):
+    """
+    (copies, N, 48, 48, 1) uint8 memmap of augmented variants of X. Built
+    once per training set and reused by later runs.
+    """
+    import hashlib
+    key  = hashlib.sha1(memoryview(np.ascontiguousarray(X))).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"augmented_{key}_{copies}x.npy")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"🗂️  Writing {copies} augmented copies of {len(X)} images to {path}...")
+        rng = np.random.default_rng(seed)
+        tmp = path + '.partial'
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(copies, *X.shape))
+        for c in range(copies):
+            for i in range(0, len(X), 4096):
+                out[c, i:i + 4096] = np.clip(np.round(augment_faces(X[i:i + 4096], rng) * 255), 0, 255)
+        out.flush()
+        del out
+        os.replace(tmp, path)
+    return np.load(path, mmap_mode='r')
+
+
+def make_train_dataset(X, y, batch_size, augment='keras', shuffle_buffer=None,
+                       data_threads=None, data_intra_op=None, cache=None, seed=None):
+    """
+    Shuffled, augmented batches from in-memory (X, y). Only indices go
+    through the shuffle buffer (the whole set by default), and batches are
+    gathered after it. data_threads sizes the pipeline's private thread pool
+    and its parallel map; data_intra_op caps each op's own parallelism.
+    """
+    import tensorflow as tf
+
+    if augment not in AUGMENT_MODES:
+        raise ValueError(f"Unknown augmentation '{augment}'. Choose from: {', '.join(AUGMENT_MODES)}")
+    if augment == 'cached' and cache is None:
+        raise ValueError("augment='cached' needs the cache from augmented_cache()")
+
+    ds = tf.data.Dataset.range(len(X)) \
+        .shuffle(shuffle_buffer or len(X), seed=seed, reshuffle_each_iteration=True) \
+        .batch(batch_size)
+
+    if augment in ('keras', 'none'):
+        X_t, y_t = tf.constant(X), tf.constant(y)
+        layers   = _augmentation() if augment == 'keras' else None
+
+        def gather(idx):
+            batch = tf.gather(X_t, idx)
+            return (layers(batch, training=True) if layers else batch), tf.gather(y_t, idx)
+    else:
+        rng = np.random.default_rng(seed)
+
+        def take(idx):
+            if augment == 'cached':
+                batch = cache[rng.integers(len(cache), size=len(idx)), idx].astype(np.float32) / 255
+            else:
+                batch = augment_faces(X[idx], rng)
+            return batch, y[idx]
+
+        def gather(idx):
+            batch, labels = tf.numpy_function(take, [idx], (tf.float32, tf.float32))
+            batch.set_shape((None, 48, 48, 1))
+            labels.set_shape((None, y.shape[1]))
+            return batch, labels
+
+    ds = ds.map(gather, num_parallel_calls=data_threads or tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+
+    options = tf.data.Options()
+    if data_threads:
+        options.threading.private_threadpool_size = data_threads
+    if data_intra_op:
+        options.threading.max_intra_op_parallelism = data_intra_op
+    return ds.with_options(options)
+
+
+def _save_profile(path, epoch_profiles, **config):
+    import json
+    with open(path, 'w') as f:
+        json.dump({**config, 'epochs': epoch_profiles}, f, indent=2)
+    print(f"⏱️  Step profile saved to {path}")
+
+
+def fit_profiled(model, train_ds, val_ds, epochs, callbacks=()):
+    """
+    model.fit() as a plain loop that times each step: waiting for the next
+    batch from the input pipeline vs running the train step. Returns
+    (history, one profile dict per epoch).
+    """
+    import tensorflow as tf
+
+    history = tf.keras.callbacks.History()
+    hooks   = tf.keras.callbacks.CallbackList(list(callbacks) + [history], model=model,
+                                              epochs=epochs, verbose=1)
+    profiles = []
+    model.stop_training = False
+    hooks.on_train_begin()
+    for epoch in range(epochs):
+        hooks.on_epoch_begin(epoch)
+        totals, steps, samples = {}, 0, 0
+        wait = compute = 0.0
+        start    = time.perf_counter()
+        iterator = iter(train_ds)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                x, y = next(iterator)
+            except StopIteration:
+                break
+            t1 = time.perf_counter()
+            hooks.on_train_batch_begin(steps)
+            logs = model.train_on_batch(x, y, return_dict=True)
+            t2 = time.perf_counter()
+            hooks.on_train_batch_end(steps, logs)
+
+            n = int(x.shape[0])
+            for k, v in logs.items():
+                totals[k] = totals.get(k, 0.0) + float(v) * n
+            wait    += t1 - t0
+            compute += t2 - t1
+            steps   += 1
+            samples += n
+
+        elapsed = time.perf_counter() - start
+        logs = {k: v / max(samples, 1) for k, v in totals.items()}
+        if val_ds is not None:
+            val = model.evaluate(val_ds, verbose=0, return_dict=True)
+            logs.update({f"val_{k}": v for k, v in val.items()})
+
+        step_ms  = 1000 * (wait + compute) / max(steps, 1)
+        wait_pct = 100 * wait / max(wait + compute, 1e-9)
+        profiles.append({
+            'epoch'          : epoch + 1,
+            'steps'          : steps,
+            'seconds'        : round(elapsed, 2),
+            'step_ms'        : round(step_ms, 2),
+            'input_wait_ms'  : round(1000 * wait / max(steps, 1), 2),
+            'compute_ms'     : round(1000 * compute / max(steps, 1), 2),
+            'input_wait_pct' : round(wait_pct, 1),
+            'images_per_sec' : round(samples / max(elapsed, 1e-9), 1),
+        })
+        p = profiles[-1]
+        print(f"Epoch {epoch + 1}/{epochs} - {elapsed:.1f}s - " +
+              ' - '.join(f"{k}: {v:.4f}" for k, v in logs.items()))
+        print(f"  ⏱️  {p['step_ms']:.1f} ms/step = {p['input_wait_ms']:.1f} ms input wait "
+              f"({p['input_wait_pct']:.0f}%) + {p['compute_ms']:.1f} ms compute, "
+              f"{p['images_per_sec']:.0f} images/s → "
+              f"{'input-bound' if wait_pct >= 20 else 'compute-bound'}")
+
+        hooks.on_epoch_end(epoch, logs)
+        if model.stop_training:
+            break
+    hooks.on_train_end()
+    return history, profiles
+
+
+# ----------------------------------------------------------------------
+# Incremental training
+#
+# Every trained model gets a manifest next to it (<model>.manifest.json)
+# mapping the content hash of each training image to its label. Incremental
+# runs fine-tune only on images whose hash (or label) the base model has not
+# seen, mixed with a replay sample of old ones so earlier classes are not
+# forgotten, and save the result as the next emotion_model_vN.h5.
+
+def _file_hash(path):
+    import hashlib
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def build_manifest(data_path, labels=EMOTION_LABELS):
+    """{content sha1: {'label': idx, 'path': path}} for a labeled directory."""
+    return {_file_hash(path): {'label': idx, 'path': path}
+            for path, idx in list_labeled_images(data_path, labels)}
+
+
+def manifest_path(model_path):
+    return os.path.splitext(model_path)[0] + '.manifest.json'
+
+
+def read_manifest(model_path):
+    import json
+    try:
+        with open(manifest_path(model_path)) as f:
+            return json.load(f)['samples']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_manifest(model_path, samples, parent=None):
+    import json
+    import time
+    with open(manifest_path(model_path), 'w') as f:
+        json.dump({'model': os.path.basename(model_path), 'parent': parent,
+                   'created': int(time.time()),
+                   'samples': {h: {'label': s['label']} for h, s in samples.items()}}, f)
+
+
+def next_model_version(model_dir='models'):
+    import re
+    versions = [int(m.group(1)) for m in
+                (re.match(r'emotion_model_v(\d+)\.h5$', n) for n in os.listdir(model_dir)) if m]
+    return os.path.join(model_dir, f"emotion_model_v{max(versions, default=0) + 1}.h5")
+
+
+def load_labeled_faces(items, workers=None):
+    """Preprocess (path, label) items in parallel into (X, y) arrays."""
+    from concurrent.futures import ThreadPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    step    = max(1, len(items) // (4 * workers))
+    with ThreadPoolExecutor(workers) as pool:
+        parts = list(pool.map(_load_batch, [items[i:i + step] for i in range(0, len(items), step)]))
+    return (np.concatenate([p[0] for p in parts]) if parts else np.empty((0, 48, 48, 1), np.float32),
+            np.concatenate([p[1] for p in parts]) if parts else np.empty(0, int))
+
+
+def train_incremental(train_data_path, base_model_path, epochs=3, batch_size=64,
+                      replay_ratio=1.0, learning_rate=1e-4, output_path=None, seed=42,
+                      augment='keras', shuffle_buffer=None, data_threads=None,
+                      data_intra_op=None, profile=False, cache_dir='cache', cache_copies=8):
+    """
+    Fine-tune `base_model_path` on the samples it has not seen plus
+    `replay_ratio` times as many previously seen ones. Returns
+    (history, model, output_path), or None when there is nothing new.
+    The input pipeline and profile options are as in train_emotion_model.
+    """
+    import tensorflow as tf
+
+    seen = read_manifest(base_model_path)
+    if seen is None:
+        raise ValueError(f"No manifest for {base_model_path}; create one with "
+                         f"train_model.py --init-manifest")
+
+    current = build_manifest(train_data_path)
+    new     = [(s['path'], s['label']) for h, s in current.items()
+               if h not in seen or seen[h]['label'] != s['label']]
+    old     = [(s['path'], s['label']) for h, s in current.items()
+               if h in seen and seen[h]['label'] == s['label']]
+    print(f"🆕 {len(new)} new or relabeled samples, {len(old)} already seen")
+    if not new:
+        return None
+
+    rng    = np.random.default_rng(seed)
+    n_old  = min(len(old), int(len(new) * replay_ratio))
+    replay = [old[i] for i in rng.choice(len(old), n_old, replace=False)] if n_old else []
+    print(f"🔁 Replaying {len(replay)} old samples")
+
+    X, y = load_labeled_faces(new + replay)
+    order = rng.permutation(len(X))
+    X, y  = X[order], tf.keras.utils.to_categorical(y[order], num_classes=len(EMOTION_LABELS))
+    n_val = max(1, len(X) // 10) if len(X) >= 20 else 0
+
+    model = tf.keras.models.load_model(base_model_path, compile=False)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate),
+                  loss='categorical_crossentropy', metrics=['accuracy'])
+
+    cache = augmented_cache(X[n_val:], cache_dir, cache_copies, seed) if augment == 'cached' else None
+    train_ds = make_train_dataset(X[n_val:], y[n_val:], batch_size, augment, shuffle_buffer,
+                                  data_threads, data_intra_op, cache=cache, seed=seed)
+    val_ds = tf.data.Dataset.from_tensor_slices((X[:n_val], y[:n_val])).batch(batch_size) \
+        if n_val else None
+
+    output_path = output_path or next_model_version(os.path.dirname(base_model_path) or '.')
+    if profile:
+        history, epoch_profiles = fit_profiled(model, train_ds, val_ds, epochs)
+        _save_profile(os.path.splitext(output_path)[0] + '.profile.json', epoch_profiles,
+                      augment=augment, batch_size=batch_size, data_threads=data_threads,
+                      data_intra_op=data_intra_op, incremental=True)
+    else:
+        history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, verbose=1)
+
+    model.save(output_path)
+    write_manifest(output_path, {**seen, **current}, parent=os.path.basename(base_model_path))
+    print(f"💾 Saved {output_path}")
+    return history, model, output_path
+
+
+# ----------------------------------------------------------------------
+# Offline evaluation
+def list_labeled_images(data_path, labels=EMOTION_LABELS):
+    """(path, class index) for every image in data_path/<label>/, like data/train."""
+    items = []
+    for idx, label in enumerate(labels):
+        folder = os.path.join(data_path, label)
+        if not os.path.isdir(folder):
+            continue
+        items.extend((os.path.join(folder, name), idx) for name in sorted(os.listdir(folder))
+                     if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    return items
+
+
+def _load_batch(items):
+    """Read and preprocess one batch of labeled faces (runs in a worker thread)."""
+    faces, targets = [], []
+    for path, idx in items:
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            continue
+        faces.append(preprocess_face(img))
+        targets.append(idx)
+    if not faces:
+        return np.empty((0, 48, 48, 1), np.float32), np.empty(0, int)
+    return np.concatenate(faces), np.array(targets)
+
+
+def load_predictor(model_path, backend=None):
+    """
+    Batch predict function for a model file. backend is 'keras' (.h5/.keras)
+    or 'tflite' (.tflite); by default it follows the file extension.
+    """
+    import tensorflow as tf
+
+    backend = backend or ('tflite' if model_path.endswith('.tflite') else 'keras')
+    if backend == 'keras':
+        model = tf.keras.models.load_model(model_path, compile=False)
+        return lambda batch: np.asarray(model.predict_on_batch(batch))
+
+    if backend != 'tflite':
+        raise ValueError(f"Unknown backend '{backend}'. Choose from: keras, tflite")
+    interpreter = tf.lite.Interpreter(model_path=model_path,
+                                      num_threads=os.cpu_count())
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    shape = [None]
+
+    def predict(batch):
+        if shape[0] != len(batch):
+            interpreter.resize_tensor_input(inp['index'], [len(batch), 48, 48, 1])
+            interpreter.allocate_tensors()
+            shape[0] = len(batch)
+        if inp['dtype'] != np.float32:
+            scale, zero = inp['quantization']
+            batch = np.round(batch / scale + zero).astype(inp['dtype'])
+        interpreter.set_tensor(inp['index'], batch)
+        interpreter.invoke()
+        result = interpreter.get_tensor(out['index'])
+        if out['dtype'] != np.float32:
+            scale, zero = out['quantization']
+            result = (result.astype(np.float32) - zero) * scale
+        return result
+
+    return predict
+
+
+def evaluate_emotion_model(model_path, data_path, batch_size=512, workers=None,
+                           backend=None, limit=None, labels=EMOTION_LABELS):
+    """
+    Accuracy and confusion matrix of a model over a labeled directory.
+
+    Batches are read and preprocessed on a thread pool (OpenCV releases
+    the GIL) a few batches ahead of inference, so decoding overlaps with
+    the model running on the previous batch.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    items = list_labeled_images(data_path, labels)
+    if limit:
+        rng = np.random.default_rng(0)
+        items = [items[i] for i in sorted(rng.permutation(len(items))[:limit])]
+    if not items:
+        raise ValueError(f"No labeled images found under {data_path}")
+
+    predict   = load_predictor(model_path, backend)
+    predict(np.zeros((1, 48, 48, 1), np.float32))    # build / allocate before timing
+
+    workers   = workers or os.cpu_count() or 1
+    chunks    = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    infer_s   = 0.0
+    wait_s    = 0.0
+    start     = time.perf_counter()
+
+    with ThreadPoolExecutor(workers) as pool:
+        # Split each batch across the pool; keep up to two batches in flight
+        def submit(chunk):
+            step = max(1, len(chunk) // workers)
+            return [pool.submit(_load_batch, chunk[j:j + step]) for j in range(0, len(chunk), step)]
+
+        pending = [submit(c) for c in chunks[:2]]
+        for i in range(len(chunks)):
+            t0 = time.perf_counter()
+            parts = [f.result() for f in pending.pop(0)]
+            wait_s += time.perf_counter() - t0
+            if i + 2 < len(chunks):
+                pending.append(submit(chunks[i + 2]))
+
+            batch   = np.concatenate([p[0] for p in parts])
+            targets = np.concatenate([p[1] for p in parts])
+            if not len(batch):
+                continue
+            t0 = time.perf_counter()
+            predicted = np.argmax(predict(batch), axis=1)
+            infer_s += time.perf_counter() - t0
+            np.add.at(confusion, (targets, predicted), 1)
+
+    elapsed = time.perf_counter() - start
+    total   = int(confusion.sum())
+    correct = int(np.trace(confusion))
+    per_class = {}
+    for idx, label in enumerate(labels):
+        support   = int(confusion[idx].sum())
+        predicted = int(confusion[:, idx].sum())
+        hits      = int(confusion[idx, idx])
+        per_class[label] = {
+            'support'  : support,
+            'precision': round(hits / predicted, 4) if predicted else None,
+            'recall'   : round(hits / support, 4) if support else None,
+        }
+
+    return {
+        'model'             : model_path,
+        'backend'           : backend or ('tflite' if model_path.endswith('.tflite') else 'keras'),
+        'images'            : total,
+        'skipped'           : len(items) - total,
+        'accuracy'          : round(correct / total, 4) if total else None,
+        'per_class'         : per_class,
+        'labels'            : list(labels),
+        'confusion'         : confusion.tolist(),
+        'seconds'           : round(elapsed, 2),
+        'images_per_second' : round(total / elapsed, 1) if elapsed else None,
+        'inference_seconds' : round(infer_s, 2),
+        'input_wait_seconds': round(wait_s, 2),
+    }
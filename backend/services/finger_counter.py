@@ -3,25 +3,114 @@
 # Compatible with mediapipe >= 0.10.x on Windows
 
 import cv2
+import queue
+import threading
+import time
 import numpy as np
 import mediapipe as mp
+from contextlib import contextmanager
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 
+from services.profiles import get_profile, downscale
+from utils.annotation import render_overlays
+from utils.thread_budget import thread_budget
+
+
+class LandmarkerPool:
+    """
+    Pool of HandLandmarker instances. A landmarker is not safe to share
+    between threads, so each call checks one out; instances are created
+    lazily up to max_size and callers wait when all of them are busy.
+    """
+
+    def __init__(self, options, max_size=1):
+        self._options   = options
+        self.max_size   = max(1, max_size)
+        self._idle      = queue.LifoQueue()
+        self._created   = 0
+        self._in_use    = 0
+        self._lock      = threading.Lock()
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max   = 0.0
+
+    @contextmanager
+    def checkout(self):
+        """Check a HandLandmarker out of the pool, waiting if all are busy."""
+        start = time.perf_counter()
+        try:
+            detector = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.max_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    detector = vision.HandLandmarker.create_from_options(self._options)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                detector = self._idle.get()
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self._in_use     += 1
+            self._checkouts  += 1
+            self._wait_total += waited
+            self._wait_max    = max(self._wait_max, waited)
+        try:
+            yield detector
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(detector)
+
+    def warm(self):
+        """Create one instance up front so configuration errors surface early."""
+        with self.checkout():
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size'   : self.max_size,
+                'created'    : self._created,
+                'in_use'     : self._in_use,
+                'checkouts'  : self._checkouts,
+                'avg_wait_ms': round(1000 * self._wait_total / self._checkouts, 2)
+                               if self._checkouts else 0.0,
+                'max_wait_ms': round(1000 * self._wait_max, 2),
+            }
+
+    def close(self):
+        while not self._idle.empty():
+            try:
+                self._idle.get_nowait().close()
+            except Exception:
+                pass
+
 
 class FingerCounter:
-    def __init__(self):
-        base_options = python.BaseOptions(
+    def __init__(self, pool_size=None):
+        """
+        pool_size: maximum number of HandLandmarker instances per num_hands
+        setting (see services/profiles.py); request threads check them out
+        of a LandmarkerPool. Defaults to the MediaPipe thread budget, or 1.
+        """
+        pool_size = pool_size or thread_budget()['mediapipe'] or 1
+        self._base_options = python.BaseOptions(
             model_asset_path=self._get_model_path()
         )
-        options = vision.HandLandmarkerOptions(
-            base_options=base_options,
-            num_hands=2,
-            min_hand_detection_confidence=0.7,
-            min_hand_presence_confidence=0.7,
-            min_tracking_confidence=0.5
-        )
-        self.detector = vision.HandLandmarker.create_from_options(options)
+        self.pool_size = max(1, pool_size)
+        self._pools    = {}
+        self._lock     = threading.Lock()
+
+        # Create the default landmarker eagerly so startup fails fast
+        self._pool(get_profile()['num_hands']).warm()
 
         self.finger_tips  = [4, 8, 12, 16, 20]
         self.finger_pips  = [3, 6, 10, 14, 18]
@@ -48,12 +137,35 @@ class FingerCounter:
         return model_path
 
     # ------------------------------------------------------------------
-    def count_fingers(self, image):
+    def _pool(self, num_hands):
+        with self._lock:
+            if num_hands not in self._pools:
+                options = vision.HandLandmarkerOptions(
+                    base_options=self._base_options,
+                    num_hands=num_hands,
+                    min_hand_detection_confidence=0.7,
+                    min_hand_presence_confidence=0.7,
+                    min_tracking_confidence=0.5
+                )
+                self._pools[num_hands] = LandmarkerPool(options, self.pool_size)
+            return self._pools[num_hands]
+
+    def pool_stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {f"num_hands_{n}": pool.stats() for n, pool in sorted(pools.items())}
+
+    # ------------------------------------------------------------------
+    def count_fingers(self, image, profile=None):
         """Count raised fingers in a BGR image. Returns dict with results."""
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        profile = get_profile(profile)
+        # Landmarks are normalized, so a downscaled frame needs no remapping
+        small, _  = downscale(image, profile['max_side'])
+        image_rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
         mp_image  = mp.Image(image_format=mp.ImageFormat.SRGB, data=image_rgb)
 
-        detection_result = self.detector.detect(mp_image)
+        with self._pool(profile['num_hands']).checkout() as detector:
+            detection_result = detector.detect(mp_image)
 
         if not detection_result.hand_landmarks:
             return {
@@ -110,33 +222,28 @@ class FingerCounter:
         return fingers_up
 
     # ------------------------------------------------------------------
-    def draw_results(self, image, results):
-        """Draw finger count text on image. No landmark drawing (Windows safe)."""
+    def overlays(self, results, image_shape=None):
+        """Annotation primitives: finger count text. No landmark drawing (Windows safe)."""
         if results.get('hands_detected', 0) == 0:
-            return image
-
-        image_copy = image.copy()
+            return []
 
-        # Draw total count
-        cv2.putText(
-            image_copy,
-            f"Fingers: {results['total_fingers']}",
-            (10, 50),
-            cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3
-        )
+        # Total count
+        ops = [('text', f"Fingers: {results['total_fingers']}", (10, 50), 1.5, (0, 255, 0), 3)]
 
-        # Draw per-hand info
+        # Per-hand info
         y = 100
         for hand_data in results['hands']:
-            cv2.putText(
-                image_copy,
-                f"{hand_data['hand']}: {hand_data['fingers_up']} fingers",
-                (10, y),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2
-            )
+            ops.append(('text', f"{hand_data['hand']}: {hand_data['fingers_up']} fingers",
+                        (10, y), 0.8, (0, 255, 0), 2))
             y += 40
 
-        return image_copy
+        return ops
+
+    def draw_results(self, image, results):
+        """Draw finger count text on image."""
+        if results.get('hands_detected', 0) == 0:
+            return image
+        return render_overlays(image, self.overlays(results, image.shape))
 
     # ------------------------------------------------------------------
     def process_video_frame(self, frame):
@@ -146,8 +253,5 @@ class FingerCounter:
 
     # ------------------------------------------------------------------
     def __del__(self):
-        if hasattr(self, 'detector'):
-            try:
-                self.detector.close()
-            except Exception:
-                pass
+        for pool in getattr(self, '_pools', {}).values():
+            pool.close()
@@ -0,0 +1,350 @@
+# Background Job Queue
+# services/job_queue.py
+#
+# Local SQLite-backed queue for long-running analyses. Inputs are spooled
+# to the uploads folder, worker processes pick jobs up and store results,
+# and finished jobs are removed once their TTL expires. No broker needed.
+#
+# One process per host owns the workers (an flock on uploads/jobs.lock), so
+# several gunicorn workers do not each start their own. Workers are plain
+# `python -m services.job_queue worker` subprocesses, not multiprocessing
+# children, so they never re-import app.py, and they exit with their owner.
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zipfile
+
+try:
+    import fcntl
+except ImportError:   # Windows: no lock, every process may start workers
+    fcntl = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id        TEXT PRIMARY KEY,
+    status    TEXT NOT NULL,
+    kind      TEXT NOT NULL,
+    analyzers TEXT NOT NULL,
+    options   TEXT NOT NULL DEFAULT '{}',
+    input_dir TEXT NOT NULL,
+    result    TEXT,
+    error     TEXT,
+    created   REAL NOT NULL,
+    started   REAL,
+    finished  REAL,
+    heartbeat REAL,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    expires   REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+"""
+
+
+class JobStore:
+    """Thin wrapper around the jobs table. Safe to use from several processes."""
+
+    def __init__(self, db_path, ttl=3600, lease=120, max_attempts=3):
+        self.db_path      = db_path
+        self.ttl          = ttl
+        self.lease        = lease
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'heartbeat' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+            if 'attempts' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ------------------------------------------------------------------
+    def add(self, job_id, kind, analyzers, input_dir, options=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, kind, analyzers, options, input_dir, created) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, ','.join(analyzers), json.dumps(options or {}),
+                 input_dir, time.time())
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id'  : row['id'],
+            'status'  : row['status'],
+            'kind'    : row['kind'],
+            'created' : row['created'],
+            'started' : row['started'],
+            'finished': row['finished'],
+        }
+        if row['status'] == 'queued':
+            with self._connect() as conn:
+                job['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?",
+                    (row['created'],)
+                ).fetchone()[0]
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def claim(self):
+        """Atomically move the oldest queued job to 'running' and return it."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (now, now, row['id'])
+            )
+            conn.execute("COMMIT")
+            return dict(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id):
+        """Renew the lease on a running job."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                         (time.time(), job_id))
+
+    def finish(self, job_id, result=None, error=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, expires = ? "
+                "WHERE id = ?",
+                ('failed' if error is not None else 'done',
+                 None if result is None else json.dumps(result),
+                 error, now, now + self.ttl, job_id)
+            )
+
+    def cleanup(self):
+        """
+        Drop expired jobs and requeue running jobs whose lease ran out (worker
+        died). A job that has lost its worker max_attempts times is failed
+        instead, so an input that crashes workers cannot block the queue.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            expired = conn.execute(
+                "SELECT id, input_dir FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,)
+            ).fetchall()
+            conn.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,))
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ?, expires = ? "
+                "WHERE status = 'running' AND COALESCE(heartbeat, started) < ? AND attempts >= ?",
+                (f"Worker died while running this job ({self.max_attempts} attempts)",
+                 now, now + self.ttl, now - self.lease, self.max_attempts)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, heartbeat = NULL "
+                "WHERE status = 'running' AND COALESCE(heartbeat, started) < ?",
+                (now - self.lease,)
+            )
+        for row in expired:
+            shutil.rmtree(row['input_dir'], ignore_errors=True)
+        return len(expired)
+
+
+# ----------------------------------------------------------------------
+class JobQueue:
+    """
+    Job submission and worker management.
+
+    `workers` processes are started lazily on the first submit, each one
+    loading the analysis services once and then polling the store. Only
+    the process holding the host-wide lock starts them; the others just
+    add jobs to the store.
+    """
+
+    def __init__(self, upload_folder, workers=2, ttl=3600, poll_interval=0.5):
+        self.spool_dir     = os.path.join(upload_folder, 'jobs')
+        self.db_path       = os.path.join(upload_folder, 'jobs.db')
+        self.workers       = workers
+        self.ttl           = ttl
+        self.poll_interval = poll_interval
+        self._processes    = []
+        self._lock_file    = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.store = JobStore(self.db_path, ttl=ttl)
+
+    def _own_workers(self):
+        """Take the host-wide worker lock; False if another process holds it."""
+        if self._lock_file is not None or fcntl is None:
+            return True
+        f = open(os.path.join(os.path.dirname(self.db_path), 'jobs.lock'), 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f   # held (and the lock with it) for the life of the process
+        return True
+
+    def start(self):
+        if not self._own_workers():
+            return False
+        self._processes = [p for p in self._processes if p.poll() is None]
+        while len(self._processes) < self.workers:
+            env = {**os.environ,
+                   'PYTHONPATH': os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get('PYTHONPATH')]))}
+            self._processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'services.job_queue', 'worker', self.db_path,
+                 str(self.ttl), str(self.poll_interval), str(os.getpid())], env=env))
+        return True
+
+    # ------------------------------------------------------------------
+    def new_job_dir(self):
+        job_id  = uuid.uuid4().hex
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+        return job_id, job_dir
+
+    def submit(self, job_id, job_dir, kind, analyzers, options=None):
+        """Queue a job whose inputs were already written to job_dir."""
+        self.store.add(job_id, kind, analyzers, job_dir, options)
+        if self.workers > 0:
+            self.start()
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block until the job finishes or `timeout` seconds pass."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+
+# ----------------------------------------------------------------------
+def _input_files(job_dir):
+    return sorted(os.path.join(job_dir, n) for n in os.listdir(job_dir))
+
+
+def _file_sources(paths):
+    from utils.image_io import is_image_name, read_zip_member
+
+    for path in paths:
+        name = os.path.basename(path).split('_', 1)[-1]
+        if path.lower().endswith('.zip'):
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and is_image_name(info.filename):
+                        yield info.filename, (lambda info=info: read_zip_member(zf, info))
+        else:
+            yield name, (lambda path=path: open(path, 'rb').read())
+
+
+def run_job(job, services):
+    """Execute one claimed job with already-loaded services."""
+    from services.analysis       import run_analyzers
+    from services.batch_pipeline import BatchPipeline
+    from services.video_analyzer import VideoAnalyzer
+    from services.roi            import parse_rois
+    from utils.image_io          import decode_image
+
+    analyzers = job['analyzers'].split(',')
+    options   = json.loads(job['options'] or '{}')
+    paths     = _input_files(job['input_dir'])
+
+    if job['kind'] == 'image':
+        with open(paths[0], 'rb') as f:
+            image = decode_image(f.read())
+        return run_analyzers(image, analyzers, *services, profile=options.get('profile'),
+                             rois=parse_rois(options.get('rois'), image.shape))
+    if job['kind'] == 'batch':
+        results = list(BatchPipeline(*services).run(_file_sources(paths), analyzers,
+                                                    options.get('profile')))
+        return {'count': len(results), 'results': sorted(results, key=lambda r: r['index'])}
+    if job['kind'] == 'video':
+        return VideoAnalyzer(*services).analyze(paths[0], analyzers, **options)
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+
+def _keep_alive(store, job_id, stop):
+    """Renew the job's lease until `stop` is set."""
+    while not stop.wait(store.lease / 4):
+        store.heartbeat(job_id)
+
+
+def worker_main(db_path, ttl=3600, poll_interval=0.5, owner_pid=None, cleanup_interval=60):
+    from services.analysis import load_services, follow_models
+
+    store    = JobStore(db_path, ttl=ttl)
+    services = load_services(emotion_model=False)
+    models   = follow_models(services[0])
+    last_cleanup = 0.0
+    print(f"👷 Job worker {os.getpid()} ready")
+
+    # Exit once the process that started us is gone; its successor starts new workers
+    while owner_pid is None or os.getppid() == owner_pid:
+        if time.monotonic() - last_cleanup > cleanup_interval:
+            store.cleanup()
+            last_cleanup = time.monotonic()
+
+        job = store.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        models.sync(wait=True)
+        stop = threading.Event()
+        threading.Thread(target=_keep_alive, args=(store, job['id'], stop), daemon=True).start()
+        try:
+            store.finish(job['id'], result=run_job(job, services))
+        except Exception as e:
+            store.finish(job['id'], error=str(e) or repr(e))
+        finally:
+            stop.set()
+            # Inputs are not needed once the result is stored
+            shutil.rmtree(job['input_dir'], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # Run workers standalone: python -m services.job_queue [num_workers]
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        db_path, ttl, poll_interval, owner_pid = sys.argv[2:6]
+        worker_main(db_path, int(ttl), float(poll_interval), int(owner_pid))
+        sys.exit(0)
+
+    queue = JobQueue('uploads', workers=int(sys.argv[1]) if len(sys.argv) > 1 else 2)
+    if not queue.start():
+        sys.exit("❌ Another process already runs the job workers for uploads/jobs.db")
+    for p in queue._processes:
+        p.wait()
@@ -0,0 +1,338 @@
+# Emotion Model Registry
+# services/model_registry.py
+#
+# Hot-swapping of emotion model versions without restarting workers.
+# A version is loaded and warmed up in a background thread, then swapped in
+# with a single assignment to detector.model; requests already running keep
+# the model they started with. A candidate version can shadow a fraction of
+# traffic, recording its latency and agreement with the active model.
+#
+# The desired state lives in models/registry.json, so every gunicorn worker
+# (and every restart) converges on the same active model and candidate.
+# Job and bulk worker processes use a registry with shadow=False and call
+# sync(wait=True) between units of work, so they follow swaps too.
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+MODEL_DIR      = 'models'
+REGISTRY_FILE  = os.path.join(MODEL_DIR, 'registry.json')
+MODEL_SUFFIXES = ('.h5', '.keras')
+
+
+class UnknownModel(ValueError):
+    pass
+
+
+def read_registry(path=REGISTRY_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def model_path(name, model_dir=MODEL_DIR):
+    """Path of a model version by file name; only files directly in model_dir."""
+    path = os.path.join(model_dir, os.path.basename(name or ''))
+    if os.path.basename(name or '') != name or not name.endswith(MODEL_SUFFIXES) \
+            or not os.path.exists(path):
+        raise UnknownModel(f"Unknown model '{name}'")
+    return path
+
+
+class LatencyStats:
+    def __init__(self):
+        self.calls    = 0
+        self.faces    = 0
+        self.total_ms = 0.0
+        self.max_ms   = 0.0
+
+    def add(self, ms, faces):
+        self.calls    += 1
+        self.faces    += faces
+        self.total_ms += ms
+        self.max_ms    = max(self.max_ms, ms)
+
+    def stats(self):
+        return {
+            'calls'          : self.calls,
+            'avg_ms'         : round(self.total_ms / self.calls, 2) if self.calls else None,
+            'avg_ms_per_face': round(self.total_ms / self.faces, 3) if self.faces else None,
+            'max_ms'         : round(self.max_ms, 2),
+        }
+
+
+class ModelRegistry:
+    def __init__(self, detector, model_dir=MODEL_DIR, registry_file=REGISTRY_FILE,
+                 sync_interval=5.0, shadow=True):
+        self.detector        = detector
+        self.model_dir       = model_dir
+        self.registry_file   = registry_file
+        self.sync_interval   = sync_interval
+        self.shadow          = shadow  # False: ignore candidates (worker processes)
+        self.active          = None    # name of detector.model's version
+        self.wanted          = None    # version being switched to
+        self.candidate       = None    # (name, model) shadowing traffic
+        self.wanted_candidate = None
+        self.shadow_fraction = 0.0
+        self.loading         = {}      # name -> 'loading' | 'ready' | error message
+        self._waiters        = {}      # name -> on_ready callbacks of the load in flight
+        self.latency         = {}      # name -> LatencyStats
+        self.agreement       = {'compared': 0, 'agreed': 0, 'skipped': 0}
+        self._lock           = threading.Lock()
+        self._shadow         = ThreadPoolExecutor(1, thread_name_prefix='shadow')
+        self._shadow_busy    = False
+        self._synced_mtime   = None
+        detector.on_predict  = self._observe
+
+    # ------------------------------------------------------------------
+    # Loading
+    def _load(self, name):
+        """Load and warm a version; the first predict builds the graph."""
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path(name, self.model_dir), compile=False)
+        for n in (1, 8):
+            model.predict_on_batch(np.zeros((n, 48, 48, 1), np.float32))
+        return model
+
+    def _load_async(self, name, on_ready, wait=False):
+        """
+        Load `name` on a background thread (inline with wait=True), then call
+        on_ready(name, model). Requests for a version that is already
+        loading share that load and all their callbacks run.
+        """
+        with self._lock:
+            waiters = self._waiters.setdefault(name, [])
+            waiters.append(on_ready)
+            if len(waiters) > 1:
+                return
+            self.loading[name] = 'loading'
+
+        def run():
+            started = time.monotonic()
+            try:
+                model = self._load(name)
+            except Exception as e:
+                with self._lock:
+                    self.loading[name] = f"failed: {e}"
+                    self._waiters.pop(name, None)
+                    # Keep serving the active version; a later sync() may retry
+                    if self.wanted == name:
+                        self.wanted = None
+                print(f"❌ Loading model {name} failed: {e}")
+                return
+            with self._lock:
+                callbacks = self._waiters.pop(name, [])
+                self.loading[name] = 'ready'
+            for callback in callbacks:
+                callback(name, model)
+            print(f"✅ Model {name} ready in {time.monotonic() - started:.1f}s")
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, daemon=True, name=f"load-{name}").start()
+
+    def _swap(self, name, model, persist=False):
+        with self._lock:
+            # A later activate() may have asked for another version meanwhile
+            if self.wanted not in (None, name):
+                return
+            self.detector.model = model
+            self.active = name
+        if persist:
+            # Only a version that loaded is handed to the other workers
+            self._write(active=name)
+
+    def _set_candidate(self, name, model):
+        with self._lock:
+            if self.wanted_candidate == name:
+                self.candidate = (name, model)
+
+    def _load_candidate(self, name, wait=False):
+        with self._lock:
+            self.wanted_candidate = name
+            self.candidate = None
+        if name and self.shadow:
+            self._load_async(name, self._set_candidate, wait)
+
+    def load_initial(self):
+        """Synchronously load the registry's active version, else the usual defaults."""
+        from services.analysis import load_emotion_model
+
+        path = load_emotion_model(self.detector)
+        self.active = os.path.basename(path) if path else None
+        self._synced_mtime = self._registry_mtime()
+        wanted = read_registry(self.registry_file)
+        if wanted.get('candidate') and self.shadow:
+            self.shadow_fraction = wanted.get('shadow_fraction', 0.0)
+            self._load_candidate(wanted['candidate'])
+        return self.active
+
+    # ------------------------------------------------------------------
+    # Control (persisted, so the other workers follow)
+    def _write(self, **changes):
+        state = read_registry(self.registry_file)
+        state.update(changes)
+        tmp = self.registry_file + f'.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.registry_file)
+        self._synced_mtime = self._registry_mtime()
+
+    def activate(self, name):
+        """
+        Load `name` in the background and switch all traffic to it. The
+        registry is updated once it has loaded here; a failed load leaves
+        the active version (and the registry) as they were.
+        """
+        model_path(name, self.model_dir)
+        self.activate_local(name, persist=True)
+
+    def set_candidate(self, name, shadow_fraction):
+        model_path(name, self.model_dir)
+        shadow_fraction = min(max(float(shadow_fraction), 0.0), 1.0)
+        self._write(candidate=name, shadow_fraction=shadow_fraction)
+        self.shadow_fraction = shadow_fraction
+        self.agreement = {'compared': 0, 'agreed': 0, 'skipped': 0}
+        self._load_candidate(name)
+
+    def clear_candidate(self):
+        self._write(candidate=None, shadow_fraction=0.0)
+        self._load_candidate(None)
+        self.shadow_fraction = 0.0
+
+    def promote(self):
+        """Make the (loaded) candidate the active model."""
+        with self._lock:
+            candidate = self.candidate
+        if candidate is None:
+            raise UnknownModel("No candidate model is loaded")
+        self._write(active=candidate[0], candidate=None, shadow_fraction=0.0)
+        with self._lock:
+            self.wanted = candidate[0]
+        self._swap(*candidate)
+        self._load_candidate(None)
+        self.shadow_fraction = 0.0
+        return candidate[0]
+
+    def _registry_mtime(self):
+        try:
+            return os.stat(self.registry_file).st_mtime
+        except OSError:
+            return None
+
+    def sync(self, wait=False):
+        """
+        Follow changes made through another worker; cheap when nothing
+        changed. With wait=True a new active version is loaded before
+        returning (worker processes call this between jobs).
+        """
+        mtime = self._registry_mtime()
+        if mtime is None or mtime == self._synced_mtime:
+            return
+        self._synced_mtime = mtime
+        wanted = read_registry(self.registry_file)
+        try:
+            if wanted.get('active') and wanted['active'] not in (self.active, self.wanted):
+                self.activate_local(wanted['active'], wait)
+            candidate = wanted.get('candidate') if self.shadow else None
+            self.shadow_fraction = wanted.get('shadow_fraction', 0.0) if candidate else 0.0
+            if candidate != self.wanted_candidate:
+                self._load_candidate(candidate)
+        except UnknownModel as e:
+            print(f"⚠️  {e} in {self.registry_file}")
+
+    def activate_local(self, name, wait=False, persist=False):
+        """
+        Swap to `name` in this worker (and with persist=True record it in the
+        registry once loaded); reuses the candidate if it is that version.
+        """
+        with self._lock:
+            self.wanted = name
+            candidate   = self.candidate
+        if candidate and candidate[0] == name:
+            self._swap(*candidate, persist=persist)
+        else:
+            self._load_async(name, partial(self._swap, persist=persist), wait)
+
+    def start_sync(self):
+        def run():
+            while True:
+                time.sleep(self.sync_interval)
+                self.sync()
+        threading.Thread(target=run, daemon=True, name='model-registry-sync').start()
+
+    # ------------------------------------------------------------------
+    # Latency and shadow traffic
+    def _stats_for(self, name):
+        if name not in self.latency:
+            self.latency[name] = LatencyStats()
+        return self.latency[name]
+
+    def _observe(self, model, batch, predictions, elapsed_ms):
+        """Called by EmotionDetector after every model call."""
+        with self._lock:
+            name = self.active if model is self.detector.model else None
+            self._stats_for(name or 'previous').add(elapsed_ms, len(batch))
+            candidate = self.candidate
+            if candidate is None or random.random() >= self.shadow_fraction:
+                return
+            if self._shadow_busy:
+                # Never queue shadow work behind live traffic
+                self.agreement['skipped'] += 1
+                return
+            self._shadow_busy = True
+        self._shadow.submit(self._run_shadow, candidate, batch, predictions)
+
+    def _run_shadow(self, candidate, batch, predictions):
+        name, model = candidate
+        try:
+            start  = time.perf_counter()
+            shadow = np.asarray(model.predict_on_batch(batch))
+            elapsed = 1000 * (time.perf_counter() - start)
+            agreed = int(np.sum(np.argmax(shadow, axis=1) == np.argmax(predictions, axis=1)))
+            with self._lock:
+                self._stats_for(name).add(elapsed, len(batch))
+                self.agreement['compared'] += len(batch)
+                self.agreement['agreed']   += agreed
+        except Exception as e:
+            print(f"⚠️  Shadow prediction with {name} failed: {e}")
+        finally:
+            self._shadow_busy = False
+
+    # ------------------------------------------------------------------
+    def versions(self):
+        names = sorted(n for n in os.listdir(self.model_dir) if n.endswith(MODEL_SUFFIXES)) \
+            if os.path.isdir(self.model_dir) else []
+        return [{
+            'name'      : n,
+            'size_mb'   : round(os.path.getsize(os.path.join(self.model_dir, n)) / (1024 * 1024), 1),
+            'modified'  : round(os.path.getmtime(os.path.join(self.model_dir, n))),
+            'active'    : n == self.active,
+            'candidate' : bool(self.candidate) and n == self.candidate[0],
+            'status'    : self.loading.get(n),
+        } for n in names]
+
+    def stats(self):
+        with self._lock:
+            compared = self.agreement['compared']
+            return {
+                'active'         : self.active,
+                'activating'     : self.wanted if self.wanted != self.active else None,
+                'candidate'      : self.candidate[0] if self.candidate else None,
+                'shadow_fraction': self.shadow_fraction,
+                'loading'        : dict(self.loading),
+                'latency'        : {n: s.stats() for n, s in self.latency.items()},
+                'agreement'      : {**self.agreement,
+                                    'rate': round(self.agreement['agreed'] / compared, 4)
+                                    if compared else None},
+            }
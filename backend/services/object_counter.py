@@ -1,34 +1,231 @@
 # Object Counter Service
 # services/object_counter.py
 
+import threading
+import time
+
 import cv2
 import numpy as np
 
+from services.profiles import get_profile, downscale
+from utils.annotation import render_overlays
+
+METHODS = ('contour', 'blob', 'motion')
+
+
+class MotionTracker:
+    """
+    Background model plus centroid tracks for one fixed-camera stream.
+
+    Only pixels the background model flags as foreground are analyzed;
+    when there are too few of them the contour step is skipped entirely.
+    Detections are matched to existing tracks by nearest centroid; a new
+    track counts as an object entering, a track unseen for `max_missed`
+    frames as one leaving.
+    """
+
+    def __init__(self, algorithm='mog2', history=500, max_distance=0.1, max_missed=5):
+        if algorithm == 'knn':
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=history, detectShadows=True)
+        else:
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, detectShadows=True)
+        self.algorithm    = algorithm
+        self.max_distance = max_distance   # fraction of the frame diagonal
+        self.max_missed   = max_missed
+        self.tracks       = {}             # id -> {'center', 'missed'}
+        self.next_id      = 1
+        self.entered      = 0
+        self.exited       = 0
+        self.frames       = 0
+        self.skipped      = 0              # frames without enough foreground
+        self.shape        = None           # input frame shape
+        self.size         = None           # (w, h) the frames are analyzed at
+        self.scale        = 1.0
+        self.last_used    = time.monotonic()
+        self.lock         = threading.Lock()
+
+    def update(self, frame, min_area):
+        self.frames   += 1
+        self.last_used = time.monotonic()
+        mask = self.subtractor.apply(frame)
+        # Shadows are marked 127; keep confident foreground only
+        _, mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)
+        foreground = cv2.countNonZero(mask)
+
+        detections = []
+        if foreground >= min_area:
+            kernel = np.ones((3, 3), np.uint8)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for contour in contours:
+                area = cv2.contourArea(contour)
+                if area > min_area:
+                    x, y, w, h = cv2.boundingRect(contour)
+                    detections.append({
+                        'bbox'  : {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
+                        'area'  : float(area),
+                        'center': (x + w / 2.0, y + h / 2.0),
+                    })
+        else:
+            self.skipped += 1
+
+        self._match(detections, np.hypot(*frame.shape[:2]) * self.max_distance)
+        return detections, foreground / float(mask.size)
+
+    def _match(self, detections, max_distance):
+        """Greedy nearest-centroid assignment of detections to tracks."""
+        pairs = sorted(
+            (np.hypot(d['center'][0] - t['center'][0], d['center'][1] - t['center'][1]), tid, i)
+            for tid, t in self.tracks.items() for i, d in enumerate(detections)
+        )
+        used_tracks, used_dets = set(), set()
+        for dist, tid, i in pairs:
+            if dist > max_distance:
+                break
+            if tid in used_tracks or i in used_dets:
+                continue
+            used_tracks.add(tid)
+            used_dets.add(i)
+            self.tracks[tid].update(center=detections[i]['center'], missed=0)
+            detections[i]['track_id'] = tid
+
+        for i, det in enumerate(detections):
+            if i not in used_dets:
+                self.tracks[self.next_id] = {'center': det['center'], 'missed': 0}
+                det['track_id'] = self.next_id
+                used_tracks.add(self.next_id)
+                self.next_id += 1
+                self.entered += 1
+
+        for tid in [t for t in self.tracks if t not in used_tracks]:
+            self.tracks[tid]['missed'] += 1
+            if self.tracks[tid]['missed'] > self.max_missed:
+                del self.tracks[tid]
+                self.exited += 1
+
+    def stats(self):
+        return {
+            'algorithm'    : self.algorithm,
+            'frames'       : self.frames,
+            'skipped'      : self.skipped,
+            'active_tracks': len(self.tracks),
+            'entered'      : self.entered,
+            'exited'       : self.exited,
+        }
+
+
 class ObjectCounter:
-    def __init__(self):
+    def __init__(self, stream_ttl=600, max_streams=64):
         self.min_contour_area = 500  # Minimum area to be considered an object
+        self.stream_ttl  = stream_ttl    # seconds an idle stream's background model is kept
+        self.max_streams = max_streams
+        self._streams    = {}
+        self._streams_lock = threading.Lock()
         
-    def count_objects(self, image, method='contour'):
+    def count_objects(self, image, method='contour', profile=None, stream=None):
         """
         Count objects in image using different methods
         
         Methods:
         - 'contour': Uses contour detection (good for distinct objects)
         - 'blob': Uses blob detection (good for circular objects)
-        - 'template': Uses template matching (for specific objects)
+        - 'motion': Background subtraction for frames of a fixed-camera
+          `stream`; counts moving objects and tracks them in and out
+
+        The image is analyzed at the profile's max_side; results are
+        mapped back to full-resolution coordinates. A motion stream keeps
+        the size picked for its first frame, so later profile changes do
+        not reset its background model.
         """
-        if method == 'contour':
-            return self._count_by_contours(image)
-        elif method == 'blob':
-            return self._count_by_blobs(image)
+        profile = get_profile(profile)
+        if method == 'motion':
+            return self._count_by_motion(image, stream or 'default', profile['max_side'])
+
+        small, scale = downscale(image, profile['max_side'])
+        min_area = self.min_contour_area * scale * scale
+
+        if method == 'blob':
+            results = self._count_by_blobs(small, min_area)
         else:
-            return self._count_by_contours(image)
+            results = self._count_by_contours(small, profile['threshold_block'], min_area)
+
+        if scale != 1.0:
+            self._rescale(results, 1.0 / scale)
+        return results
+
+    def _rescale(self, results, factor):
+        """Map results from a downscaled frame back to full-resolution coordinates"""
+        for obj in results['objects']:
+            if 'bbox' in obj:
+                obj['bbox'] = {k: int(round(v * factor)) for k, v in obj['bbox'].items()}
+                obj['area'] = float(obj['area'] * factor * factor)
+            if 'contour' in obj:
+                obj['contour'] = np.round(obj['contour'] * factor).astype(np.int32)
+            if 'center' in obj:
+                obj['center'] = {k: float(v * factor) for k, v in obj['center'].items()}
+                obj['size']   = float(obj['size'] * factor)
+        return results
     
-    def _count_by_contours(self, image):
+    # ------------------------------------------------------------------
+    def _tracker(self, stream, shape, max_side=None, algorithm='mog2'):
+        """The stream's tracker; a new one when the input resolution changed."""
+        now = time.monotonic()
+        with self._streams_lock:
+            for sid in [k for k, t in self._streams.items() if now - t.last_used > self.stream_ttl]:
+                del self._streams[sid]
+            tracker = self._streams.get(stream)
+            if tracker is None or tracker.shape != shape:
+                if tracker is None and len(self._streams) >= self.max_streams:
+                    oldest = min(self._streams, key=lambda k: self._streams[k].last_used)
+                    del self._streams[oldest]
+                tracker = self._streams[stream] = MotionTracker(algorithm)
+                h, w = shape[:2]
+                tracker.shape = shape
+                tracker.scale = max_side / max(h, w) if max_side and max(h, w) > max_side else 1.0
+                tracker.size  = (max(1, int(w * tracker.scale)), max(1, int(h * tracker.scale)))
+            return tracker
+
+    def _count_by_motion(self, image, stream, max_side=None):
+        """Count moving objects against the stream's learned background"""
+        tracker  = self._tracker(stream, image.shape, max_side)
+        scale    = tracker.scale
+        small    = image if scale == 1.0 else \
+            cv2.resize(image, tracker.size, interpolation=cv2.INTER_AREA)
+        min_area = self.min_contour_area * scale * scale
+        with tracker.lock:
+            detections, foreground = tracker.update(small, min_area)
+            stats = tracker.stats()
+
+        objects = [{'bbox': d['bbox'], 'area': d['area'], 'track_id': d['track_id']}
+                   for d in detections]
+        results = {
+            'count'           : len(objects),
+            'method'          : 'motion',
+            'objects'         : objects,
+            'stream'          : stream,
+            'foreground_ratio': round(foreground, 4),
+            **stats
+        }
+        return self._rescale(results, 1.0 / scale) if scale != 1.0 else results
+
+    def reset_stream(self, stream):
+        """Drop a stream's background model and tracks; returns True if it existed."""
+        with self._streams_lock:
+            return self._streams.pop(stream, None) is not None
+
+    def stream_stats(self):
+        with self._streams_lock:
+            return {sid: t.stats() for sid, t in self._streams.items()}
+
+    def _count_by_contours(self, image, block_size=11, min_area=None):
         """
         Count objects using contour detection
         Works well for counting distinct objects like fingers, coins, etc.
         """
+        if min_area is None:
+            min_area = self.min_contour_area
+        
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
@@ -40,7 +237,7 @@ class ObjectCounter:
             blurred, 255,
             cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
             cv2.THRESH_BINARY_INV,
-            11, 2
+            block_size, 2
         )
         
         # Morphological operations to clean up
@@ -59,7 +256,7 @@ class ObjectCounter:
         valid_contours = []
         for contour in contours:
             area = cv2.contourArea(contour)
-            if area > self.min_contour_area:
+            if area > min_area:
                 # Get bounding box
                 x, y, w, h = cv2.boundingRect(contour)
                 
@@ -80,11 +277,14 @@ class ObjectCounter:
             'objects': valid_contours
         }
     
-    def _count_by_blobs(self, image):
+    def _count_by_blobs(self, image, min_area=None):
         """
         Count objects using blob detection
         Works well for circular objects
         """
+        if min_area is None:
+            min_area = self.min_contour_area
+        
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
@@ -93,7 +293,7 @@ class ObjectCounter:
         
         # Filter by Area
         params.filterByArea = True
-        params.minArea = self.min_contour_area
+        params.minArea = min_area
         params.maxArea = 100000
         
         # Filter by Circularity
@@ -170,60 +370,40 @@ class ObjectCounter:
             'objects': valid_contours
         }
     
-    def draw_results(self, image, results):
-        """Draw detected objects on image"""
+    def overlays(self, results, image_shape=None):
+        """Annotation primitives for detected objects"""
         if results['count'] == 0:
-            return image
-        
-        image_copy = image.copy()
-        
-        if results['method'] == 'contour' or results['method'] == 'color_detection':
+            return []
+
+        ops = []
+        if results['method'] in ('contour', 'color_detection', 'motion'):
             for obj in results['objects']:
                 bbox = obj['bbox']
-                # Draw rectangle
-                cv2.rectangle(
-                    image_copy,
-                    (bbox['x'], bbox['y']),
-                    (bbox['x'] + bbox['width'], bbox['y'] + bbox['height']),
-                    (0, 255, 0),
-                    2
-                )
-                # Draw area
-                cv2.putText(
-                    image_copy,
-                    f"Area: {int(obj['area'])}",
-                    (bbox['x'], bbox['y'] - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 255, 0),
-                    1
-                )
-        
+                # Rectangle
+                ops.append(('rect',
+                            (bbox['x'], bbox['y']),
+                            (bbox['x'] + bbox['width'], bbox['y'] + bbox['height']),
+                            (0, 255, 0), 2))
+                # Track id for moving objects, area otherwise
+                label = f"#{obj['track_id']}" if 'track_id' in obj else f"Area: {int(obj['area'])}"
+                ops.append(('text', label, (bbox['x'], bbox['y'] - 10), 0.5, (0, 255, 0), 1))
+
         elif results['method'] == 'blob':
             for obj in results['objects']:
                 center = obj['center']
-                size = obj['size']
-                # Draw circle
-                cv2.circle(
-                    image_copy,
-                    (int(center['x']), int(center['y'])),
-                    int(size),
-                    (0, 255, 0),
-                    2
-                )
-        
-        # Draw total count
-        cv2.putText(
-            image_copy,
-            f"Objects: {results['count']}",
-            (10, 50),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1.5,
-            (0, 255, 0),
-            3
-        )
-        
-        return image_copy
+                # Circle
+                ops.append(('circle', (center['x'], center['y']), obj['size'], (0, 255, 0), 2))
+
+        # Total count
+        ops.append(('text', f"Objects: {results['count']}", (10, 50), 1.5, (0, 255, 0), 3))
+
+        return ops
+
+    def draw_results(self, image, results):
+        """Draw detected objects on image"""
+        if results['count'] == 0:
+            return image
+        return render_overlays(image, self.overlays(results, image.shape))
     
     def analyze_image(self, image):
         """
@@ -0,0 +1,129 @@
+# Quality Profiles
+# services/profiles.py
+#
+# Named parameter sets that trade accuracy for speed across all three
+# services, plus a selector that picks the best profile that still fits
+# a request's remaining deadline.
+
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+PROFILES = {
+    'fast': {
+        'name'           : 'fast',
+        'max_side'       : 640,       # longest side analyzed, None = full resolution
+        'scale_factor'   : 1.3,       # Haar cascade
+        'min_neighbors'  : 4,
+        'min_face_size'  : (30, 30),
+        'num_hands'      : 1,         # HandLandmarker
+        'threshold_block': 7,         # adaptive threshold block size
+    },
+    'balanced': {
+        'name'           : 'balanced',
+        'max_side'       : 960,
+        'scale_factor'   : 1.2,
+        'min_neighbors'  : 5,
+        'min_face_size'  : (30, 30),
+        'num_hands'      : 2,
+        'threshold_block': 9,
+    },
+    'accurate': {
+        'name'           : 'accurate',
+        'max_side'       : None,
+        'scale_factor'   : 1.1,
+        'min_neighbors'  : 5,
+        'min_face_size'  : (30, 30),
+        'num_hands'      : 2,
+        'threshold_block': 11,
+    },
+}
+
+# From most to least accurate
+PROFILE_ORDER   = ['accurate', 'balanced', 'fast']
+DEFAULT_PROFILE = 'accurate'
+
+
+class UnknownProfile(ValueError):
+    pass
+
+
+def get_profile(profile=None):
+    """Accept a profile dict, a profile name or None (the default profile)."""
+    if profile is None:
+        return PROFILES[DEFAULT_PROFILE]
+    if isinstance(profile, dict):
+        return profile
+    if profile not in PROFILES:
+        raise UnknownProfile(f"Unknown profile '{profile}'. Choose from: {', '.join(PROFILE_ORDER)}")
+    return PROFILES[profile]
+
+
+def downscale(image, max_side):
+    """Return (image, scale) with the longest side at most max_side."""
+    h, w = image.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return image, 1.0
+    scale = max_side / max(h, w)
+    small = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                       interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+# ----------------------------------------------------------------------
+class ProfileSelector:
+    """
+    Tracks an exponentially weighted average latency per (endpoint, profile)
+    and picks the most accurate profile expected to finish within a budget.
+
+    A profile that stops being chosen gets no new samples, so its estimate
+    halves every `half_life` seconds since its last one; after a latency
+    spike it is retried once the estimate fits again, and the retry
+    refreshes it.
+    """
+
+    def __init__(self, alpha=0.2, half_life=30.0):
+        self.alpha     = alpha
+        self.half_life = half_life
+        self.latency   = {}   # (endpoint, profile) -> (ms, monotonic time of last sample)
+        self._lock     = threading.Lock()
+
+    def observe(self, endpoint, profile_name, elapsed_ms):
+        key = (endpoint, profile_name)
+        with self._lock:
+            prev = self.latency.get(key)
+            ms   = elapsed_ms if prev is None else prev[0] + self.alpha * (elapsed_ms - prev[0])
+            self.latency[key] = (ms, time.monotonic())
+
+    def expected(self, endpoint, profile_name):
+        """Decayed latency estimate in ms, None if never measured."""
+        entry = self.latency.get((endpoint, profile_name))
+        if entry is None:
+            return None
+        ms, seen = entry
+        return ms * 0.5 ** ((time.monotonic() - seen) / self.half_life)
+
+    @contextmanager
+    def timed(self, endpoint, profile):
+        """Record the latency of the enclosed analysis under this profile, even if it fails."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(endpoint, profile['name'], 1000 * (time.monotonic() - start))
+
+    def choose(self, endpoint, remaining_ms):
+        """Most accurate profile whose expected latency fits remaining_ms."""
+        with self._lock:
+            for name in PROFILE_ORDER:
+                expected = self.expected(endpoint, name)
+                # Unmeasured profiles are tried optimistically
+                if expected is None or expected <= remaining_ms:
+                    return PROFILES[name]
+        return PROFILES[PROFILE_ORDER[-1]]
+
+    def stats(self):
+        with self._lock:
+            return {f"{ep}:{name}": round(ms, 1) for (ep, name), (ms, _) in self.latency.items()}
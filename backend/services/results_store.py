@@ -0,0 +1,228 @@
+# Results Store
+# services/results_store.py
+#
+# Optional local SQLite index of analysis results. Each analyzed image (or
+# video frame) becomes one row with indexed summary columns (face, hand,
+# finger and object counts, top emotion, media id and timestamp) plus one
+# row per face with its emotion probabilities, so questions such as
+# "frames with more than 3 faces at least 60% angry" need no rescans.
+# Rows are keyed by content hash and analysis key, so media that was
+# already analyzed the same way can be skipped. The key includes the
+# emotion model version, and quotes are never stored (they are random per
+# response and added after a lookup).
+
+import json
+import sqlite3
+import time
+
+from services.emotion_detector import EMOTION_LABELS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    id             INTEGER PRIMARY KEY,
+    content_hash   TEXT NOT NULL,
+    analysis       TEXT NOT NULL,
+    media_id       TEXT,
+    source         TEXT,
+    frame          INTEGER,
+    ts             REAL,
+    created        REAL NOT NULL,
+    faces          INTEGER,
+    hands          INTEGER,
+    fingers        INTEGER,
+    objects        INTEGER,
+    top_emotion    TEXT,
+    top_confidence REAL,
+    result         TEXT NOT NULL,
+    UNIQUE (content_hash, analysis)
+);
+CREATE INDEX IF NOT EXISTS media_media_id ON media (media_id, frame);
+CREATE INDEX IF NOT EXISTS media_ts       ON media (ts);
+CREATE INDEX IF NOT EXISTS media_faces    ON media (faces);
+CREATE INDEX IF NOT EXISTS media_hands    ON media (hands);
+CREATE INDEX IF NOT EXISTS media_objects  ON media (objects);
+CREATE INDEX IF NOT EXISTS media_top      ON media (top_emotion, top_confidence);
+
+CREATE TABLE IF NOT EXISTS faces (
+    media      INTEGER NOT NULL REFERENCES media (id) ON DELETE CASCADE,
+    emotion    TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    {probability_columns}
+);
+CREATE INDEX IF NOT EXISTS faces_media   ON faces (media);
+CREATE INDEX IF NOT EXISTS faces_emotion ON faces (emotion, confidence);
+""".format(probability_columns=',\n    '.join(f"{label} REAL" for label in EMOTION_LABELS))
+
+SUMMARY_COLUMNS = ('media_id', 'source', 'frame', 'ts', 'created', 'faces', 'hands',
+                   'fingers', 'objects', 'top_emotion', 'top_confidence')
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def analysis_key(analyzers, profile_name, variant=None, model=None):
+    """
+    How a result was produced, e.g. 'emotion,objects@accurate+emotion_model_v2.h5'.
+    The model version only counts when emotion is among the analyzers.
+    """
+    key = ','.join(analyzers) + (f"/{variant}" if variant else '') + f"@{profile_name}"
+    return key + f"+{model}" if model and 'emotion' in analyzers else key
+
+
+def _without_quotes(results):
+    em = results.get('emotion')
+    if not em or not any('quote' in f for f in em.get('emotions', [])):
+        return results
+    faces = [{k: v for k, v in f.items() if k != 'quote'} for f in em['emotions']]
+    return {**results, 'emotion': {**em, 'emotions': faces}}
+
+
+def _summary(results):
+    """Indexed columns from a {'emotion': ..., 'fingers': ..., 'objects': ...} result."""
+    em, fi, ob = results.get('emotion'), results.get('fingers'), results.get('objects')
+    faces = (em or {}).get('emotions', [])
+    top   = max(faces, key=lambda f: f['confidence'], default=None)
+    return {
+        'faces'         : em.get('faces_detected') if em else None,
+        'hands'         : fi.get('hands_detected') if fi else None,
+        'fingers'       : fi.get('total_fingers') if fi else None,
+        'objects'       : ob.get('count') if ob else None,
+        'top_emotion'   : top and top['emotion'],
+        'top_confidence': top and top['confidence'],
+    }, faces
+
+
+class ResultsStore:
+    """Safe to use from several threads and processes (one connection per call)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    # ------------------------------------------------------------------
+    def add_many(self, records):
+        """
+        Bulk insert in one transaction. Each record has content_hash,
+        analysis and results (sections by analyzer name), optionally
+        media_id, source, frame and ts. Existing rows are replaced.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                for r in records:
+                    results = _without_quotes(r['results'])
+                    summary, faces = _summary(results)
+                    conn.execute("DELETE FROM media WHERE content_hash = ? AND analysis = ?",
+                                 (r['content_hash'], r['analysis']))
+                    cur = conn.execute(
+                        "INSERT INTO media (content_hash, analysis, media_id, source, frame, ts, "
+                        "created, faces, hands, fingers, objects, top_emotion, top_confidence, "
+                        "result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (r['content_hash'], r['analysis'], r.get('media_id'), r.get('source'),
+                         r.get('frame'), r.get('ts'), now, summary['faces'], summary['hands'],
+                         summary['fingers'], summary['objects'], summary['top_emotion'],
+                         summary['top_confidence'], json.dumps(results))
+                    )
+                    conn.executemany(
+                        f"INSERT INTO faces (media, emotion, confidence, {', '.join(EMOTION_LABELS)}) "
+                        f"VALUES (?, ?, ?, {', '.join('?' * len(EMOTION_LABELS))})",
+                        [(cur.lastrowid, f['emotion'], f['confidence'],
+                          *(f.get('all_probabilities', {}).get(l) for l in EMOTION_LABELS))
+                         for f in faces]
+                    )
+        finally:
+            conn.close()
+        return len(records)
+
+    def get(self, content_hash, analysis):
+        """Stored results for this content and analysis, or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT result FROM media WHERE content_hash = ? AND analysis = ?",
+                               (content_hash, analysis)).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else json.loads(row['result'])
+
+    def frames(self, content_hash, analysis):
+        """Stored per-frame rows of a video ('<hash>#<frame>'), in frame order."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT frame, ts, result FROM media WHERE analysis = ? AND "
+                "content_hash >= ? AND content_hash < ? ORDER BY frame",
+                (analysis, content_hash + '#', content_hash + '$')
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'frame': row['frame'], 'time': row['ts'], **json.loads(row['result'])}
+                for row in rows]
+
+    # ------------------------------------------------------------------
+    def query(self, emotion=None, min_probability=None, min_emotion_faces=1,
+              min_faces=None, max_faces=None, min_hands=None, min_fingers=None,
+              min_objects=None, max_objects=None, media_id=None, since=None, until=None,
+              include_result=False, limit=100, offset=0):
+        """
+        Media rows matching every given filter, newest first. With `emotion`,
+        at least `min_emotion_faces` faces must have that emotion's
+        probability >= `min_probability` (percent; any top-1 face otherwise).
+        """
+        where, params = [], []
+        for column, op, value in (('faces', '>=', min_faces), ('faces', '<=', max_faces),
+                                  ('hands', '>=', min_hands), ('fingers', '>=', min_fingers),
+                                  ('objects', '>=', min_objects), ('objects', '<=', max_objects),
+                                  ('media_id', '=', media_id),
+                                  ('ts', '>=', since), ('ts', '<=', until)):
+            if value is not None:
+                where.append(f"m.{column} {op} ?")
+                params.append(value)
+
+        if emotion is not None:
+            if emotion not in EMOTION_LABELS:
+                raise InvalidQuery(f"Unknown emotion '{emotion}'. "
+                                   f"Choose from: {', '.join(EMOTION_LABELS)}")
+            if min_probability is None:
+                face_filter, face_params = "f.emotion = ?", [emotion]
+            else:
+                face_filter, face_params = f"f.{emotion} >= ?", [min_probability]
+            where.append(f"(SELECT COUNT(*) FROM faces f WHERE f.media = m.id AND {face_filter}) >= ?")
+            params.extend(face_params + [min_emotion_faces])
+
+        sql = (f"SELECT m.content_hash, m.analysis, {', '.join('m.' + c for c in SUMMARY_COLUMNS)}"
+               f"{', m.result' if include_result else ''} FROM media m"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+               " ORDER BY m.created DESC, m.id DESC LIMIT ? OFFSET ?")
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params + [max(1, min(int(limit), 1000)),
+                                               max(0, int(offset))]).fetchall()
+        finally:
+            conn.close()
+
+        out = []
+        for row in rows:
+            item = dict(row)
+            if include_result:
+                item['result'] = json.loads(item['result'])
+            out.append(item)
+        return out
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            media = conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+            faces = conn.execute("SELECT COUNT(*) FROM faces").fetchone()[0]
+        finally:
+            conn.close()
+        return {'db_path': self.db_path, 'media': media, 'faces': faces}
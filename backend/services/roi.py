@@ -0,0 +1,107 @@
+# Region-of-Interest Analysis
+# services/roi.py
+#
+# Runs the services on client-specified crops only. Crops are NumPy views
+# into the decoded frame (no copy), and every coordinate in the results is
+# shifted back into full-frame space.
+
+import numpy as np
+
+
+class InvalidROI(ValueError):
+    pass
+
+
+def parse_rois(values, image_shape):
+    """
+    Parse ROIs given as dicts {'x', 'y', 'width', 'height'} or 'x,y,w,h'
+    strings. ROIs are clipped to the frame; returns a list of (x, y, w, h).
+    """
+    img_h, img_w = image_shape[:2]
+    rois = []
+    for v in values or []:
+        try:
+            if isinstance(v, dict):
+                x, y, w, h = (int(v[k]) for k in ('x', 'y', 'width', 'height'))
+            else:
+                x, y, w, h = (int(float(n)) for n in str(v).split(','))
+        except (KeyError, TypeError, ValueError):
+            raise InvalidROI(f"Invalid ROI {v!r}, expected x,y,width,height")
+
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(img_w, x + w), min(img_h, y + h)
+        if x2 - x1 < 1 or y2 - y1 < 1:
+            raise InvalidROI(f"ROI {v!r} lies outside the {img_w}x{img_h} image")
+        rois.append((x1, y1, x2 - x1, y2 - y1))
+    return rois
+
+
+def roi_dicts(rois):
+    return [{'x': x, 'y': y, 'width': w, 'height': h} for x, y, w, h in rois]
+
+
+def crop(image, roi):
+    x, y, w, h = roi
+    return image[y:y + h, x:x + w]
+
+
+def _shift_bbox(bbox, dx, dy):
+    return dict(bbox, x=bbox['x'] + dx, y=bbox['y'] + dy)
+
+
+# ----------------------------------------------------------------------
+def emotion_in_rois(emotion_detector, image, rois, profile=None):
+    """predict_emotion over the ROIs; faces from all crops share one model call."""
+    if not rois:
+        return emotion_detector.predict_emotion(image, profile)
+
+    results = emotion_detector.predict_emotions([crop(image, r) for r in rois], profile)
+    merged  = {'faces_detected': 0, 'emotions': []}
+    for i, ((dx, dy, _, _), res) in enumerate(zip(rois, results)):
+        if 'error' in res:
+            return res
+        merged['faces_detected'] += res['faces_detected']
+        for e in res['emotions']:
+            e['bbox'] = _shift_bbox(e['bbox'], dx, dy)
+            e['roi']  = i
+            merged['emotions'].append(e)
+    return merged
+
+
+def fingers_in_rois(finger_counter, image, rois, profile=None):
+    if not rois:
+        return finger_counter.count_fingers(image, profile)
+
+    merged = {'hands_detected': 0, 'total_fingers': 0, 'hands': []}
+    for i, roi in enumerate(rois):
+        res = finger_counter.count_fingers(crop(image, roi), profile)
+        merged['hands_detected'] += res['hands_detected']
+        merged['total_fingers']  += res['total_fingers']
+        for hand in res['hands']:
+            hand['roi'] = i
+            merged['hands'].append(hand)
+    return merged
+
+
+def objects_in_rois(object_counter, image, rois, profile=None, method='contour'):
+    if not rois:
+        return object_counter.count_objects(image, method, profile)
+
+    merged = None
+    for i, roi in enumerate(rois):
+        dx, dy = roi[0], roi[1]
+        res = object_counter.count_objects(crop(image, roi), method, profile)
+        for obj in res['objects']:
+            if 'bbox' in obj:
+                obj['bbox'] = _shift_bbox(obj['bbox'], dx, dy)
+            if 'center' in obj:
+                obj['center'] = {'x': obj['center']['x'] + dx, 'y': obj['center']['y'] + dy}
+            if 'contour' in obj:
+                obj['contour'] = obj['contour'] + np.array([dx, dy], dtype=obj['contour'].dtype)
+            obj['roi'] = i
+        if merged is None:
+            merged = res
+        else:
+            merged['count']   += res['count']
+            merged['objects'] += res['objects']
+    return merged
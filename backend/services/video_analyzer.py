@@ -0,0 +1,180 @@
+# Video Analysis Service
+# services/video_analyzer.py
+
+import cv2
+import numpy as np
+
+from services.analysis import run_analyzers
+
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov'}
+VIDEO_MODES      = ('stride', 'scene')
+
+
+def is_video_name(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+
+
+def video_variant(options):
+    """How frames are sampled, e.g. 'scene' or 'stride,stride=10', for results_store.analysis_key."""
+    options = dict(options)
+    mode    = options.pop('mode', 'stride')
+    return mode + ''.join(f",{k}={options[k]}" for k in sorted(options))
+
+
+class SceneChangeDetector:
+    """
+    Cheap change detector over tiny grayscale thumbnails.
+
+    A frame counts as changed when it differs from the last analyzed frame
+    by more than `scene_threshold` (mean absolute difference, 0..1), or when
+    more than `motion_threshold` of its pixels moved since the previous frame.
+    """
+
+    def __init__(self, probe_size=(64, 36), scene_threshold=0.08,
+                 motion_threshold=0.05, pixel_threshold=25):
+        self.probe_size       = probe_size
+        self.scene_threshold  = scene_threshold
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold  = pixel_threshold
+        self.keyframe = None
+        self.previous = None
+
+    def probe(self, frame):
+        gray  = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.probe_size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def check(self, probe):
+        """Return 'scene', 'motion' or None for this frame's probe."""
+        previous, self.previous = self.previous, probe
+        if self.keyframe is None:
+            return 'scene'
+        if cv2.absdiff(probe, self.keyframe).mean() / 255.0 > self.scene_threshold:
+            return 'scene'
+        if previous is not None:
+            moved = np.count_nonzero(cv2.absdiff(probe, previous) > self.pixel_threshold)
+            if moved / probe.size > self.motion_threshold:
+                return 'motion'
+        return None
+
+    def mark_keyframe(self, probe):
+        self.keyframe = probe
+
+
+class VideoAnalyzer:
+    def __init__(self, emotion_detector, finger_counter, object_counter, quotes=True):
+        self.emotion_detector = emotion_detector
+        self.finger_counter   = finger_counter
+        self.object_counter   = object_counter
+        self.quotes           = quotes
+
+    def analyze(self, video_path, analyzers, mode='stride', profile=None, **options):
+        if mode == 'scene':
+            return self.analyze_scenes(video_path, analyzers, profile=profile, **options)
+        if mode == 'stride':
+            return self.analyze_stride(video_path, analyzers, profile=profile, **options)
+        raise ValueError(f"Unknown video mode '{mode}'. Choose from: {', '.join(VIDEO_MODES)}")
+
+    def _open(self, video_path):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        return cap, cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    def _run(self, frame, analyzers, profile):
+        return run_analyzers(frame, analyzers, self.emotion_detector,
+                             self.finger_counter, self.object_counter, profile,
+                             quotes=self.quotes)
+
+    # ------------------------------------------------------------------
+    def analyze_stride(self, video_path, analyzers, stride=30, profile=None):
+        """Run the analyzers on every `stride`-th frame of a video file."""
+        cap, fps = self._open(video_path)
+        frames = []
+        idx    = 0
+        try:
+            while True:
+                # grab() skips decoding frames we are not going to analyze
+                if not cap.grab():
+                    break
+                if idx % stride == 0:
+                    ok, frame = cap.retrieve()
+                    if ok:
+                        res = self._run(frame, analyzers, profile)
+                        res['frame'] = idx
+                        res['time']  = round(idx / fps, 3)
+                        frames.append(res)
+                idx += 1
+        finally:
+            cap.release()
+
+        return {
+            'mode'           : 'stride',
+            'fps'            : fps,
+            'total_frames'   : idx,
+            'frames_analyzed': len(frames),
+            'frames'         : frames
+        }
+
+    # ------------------------------------------------------------------
+    def analyze_scenes(self, video_path, analyzers, profile=None, min_gap=0.5,
+                       max_gap=10.0, **detector_options):
+        """
+        Run the analyzers only when the content changed materially.
+
+        Every frame is probed at thumbnail size; the full analyzers run on
+        a frame that shows a scene change or significant motion, at most
+        once per `min_gap` seconds, and at least once per `max_gap` seconds
+        so slow drifts are not missed. Returns a timeline of segments, each
+        with the results of the frame that opened it.
+        """
+        cap, fps = self._open(video_path)
+        detector = SceneChangeDetector(**detector_options)
+        min_gap_frames = max(1, int(min_gap * fps))
+        max_gap_frames = max(min_gap_frames, int(max_gap * fps))
+
+        segments  = []
+        last_key  = None
+        idx       = 0
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                probe   = detector.probe(frame)
+                trigger = detector.check(probe)
+
+                if last_key is not None:
+                    since = idx - last_key
+                    if since < min_gap_frames:
+                        trigger = None
+                    elif trigger is None and since >= max_gap_frames:
+                        trigger = 'max_gap'
+
+                if trigger:
+                    detector.mark_keyframe(probe)
+                    if segments:
+                        segments[-1]['end_frame'] = idx - 1
+                        segments[-1]['end']       = round((idx - 1) / fps, 3)
+                    segments.append({
+                        'start_frame': idx,
+                        'start'      : round(idx / fps, 3),
+                        'trigger'    : trigger,
+                        'results'    : self._run(frame, analyzers, profile)
+                    })
+                    last_key = idx
+                idx += 1
+        finally:
+            cap.release()
+
+        if segments:
+            segments[-1]['end_frame'] = idx - 1
+            segments[-1]['end']       = round((idx - 1) / fps, 3)
+
+        return {
+            'mode'           : 'scene',
+            'fps'            : fps,
+            'total_frames'   : idx,
+            'frames_analyzed': len(segments),
+            'segments'       : segments
+        }
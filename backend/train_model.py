@@ -22,13 +22,23 @@ data/
     ...
 
 Then run: python train_model.py
+
+After adding new labeled images, fine-tune instead of retraining:
+    python train_model.py --incremental
+
+To see whether training is input-bound or compute-bound, and try a
+faster augmentation path:
+    python train_model.py --profile --epochs 2
+    python train_model.py --profile --augment numpy --data-threads 4
 """
 
+import argparse
 import os
 import sys
 import numpy as np
 import pandas as pd
-from services.emotion_detector import EmotionDetector, train_emotion_model
+from services.emotion_detector import (EmotionDetector, train_emotion_model, train_incremental,
+                                       build_manifest, write_manifest, AUGMENT_MODES)
 import matplotlib.pyplot as plt
 
 def plot_training_history(history):
@@ -58,7 +68,68 @@ def plot_training_history(history):
     print("📊 Training history saved to training_history.png")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the emotion detection model')
+    parser.add_argument('--incremental', action='store_true',
+                        help='fine-tune on new or changed images only, saved as the next version')
+    parser.add_argument('--base', default=None,
+                        help='model to fine-tune (default: the model the app loads)')
+    parser.add_argument('--epochs', type=int, default=None,
+                        help='default: 50 for full training, 3 for --incremental')
+    parser.add_argument('--replay-ratio', type=float, default=1.0,
+                        help='previously seen images replayed per new image (default: 1.0)')
+    parser.add_argument('--init-manifest', action='store_true',
+                        help='record the current data/train as already seen by --base, then exit')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every step and report input-pipeline wait vs compute per epoch')
+    parser.add_argument('--augment', choices=AUGMENT_MODES, default='keras',
+                        help='keras layers (default), vectorized numpy, cached pre-augmented '
+                             'copies, or none')
+    parser.add_argument('--cache-copies', type=int, default=8,
+                        help='augmented copies of the training set for --augment cached')
+    parser.add_argument('--shuffle-buffer', type=int, default=None,
+                        help='default: the whole training set')
+    parser.add_argument('--data-threads', type=int, default=None,
+                        help='tf.data private thread pool and parallel map size (default: autotune)')
+    parser.add_argument('--data-intra-op', type=int, default=None,
+                        help='max intra-op parallelism of tf.data ops')
+    return parser.parse_args(argv)
+
+
+def run_incremental(args, data_path):
+    from services.analysis import find_emotion_model
+
+    base = args.base or find_emotion_model()
+    if base is None or not os.path.exists(base):
+        print("\n❌ No trained model to start from. Run a full training first.")
+        sys.exit(1)
+
+    if args.init_manifest:
+        write_manifest(base, build_manifest(data_path))
+        print(f"✅ Recorded {data_path} as seen by {base}")
+        return
+
+    print(f"\n🔧 Fine-tuning {base} on new data in {data_path}")
+    result = train_incremental(data_path, base, epochs=args.epochs or 3,
+                               replay_ratio=args.replay_ratio,
+                               augment=args.augment,
+                               shuffle_buffer=args.shuffle_buffer,
+                               data_threads=args.data_threads,
+                               data_intra_op=args.data_intra_op,
+                               profile=args.profile,
+                               cache_copies=args.cache_copies)
+    if result is None:
+        print("✅ Nothing new to train on.")
+        return
+    _, _, output = result
+    name = os.path.basename(output)
+    print(f"\n🎉 New version: {output}")
+    print(f"   Compare:  python evaluate_model.py {output}")
+    print(f"   Activate: POST /api/models/activate {{\"name\": \"{name}\"}}")
+
+
 def main():
+    args = parse_args()
     print("="*60)
     print("🎭 EMOTION DETECTION MODEL TRAINING")
     print("="*60)
@@ -86,6 +157,10 @@ def main():
         print("   3. Run: kaggle datasets download -d msambare/fer2013")
         print("   4. Unzip and organize as shown above")
         sys.exit(1)
+
+    if args.incremental or args.init_manifest:
+        run_incremental(args, data_path)
+        return
     
     # Count images
     print(f"\n📊 Counting training images...")
@@ -108,10 +183,11 @@ def main():
     
     # Training parameters
     print("\n🔧 Training Configuration:")
-    epochs = 50
+    epochs = args.epochs or 50
     batch_size = 64
     print(f"   Epochs: {epochs}")
     print(f"   Batch Size: {batch_size}")
+    print(f"   Augmentation: {args.augment}")
     print(f"   Optimizer: Adam")
     print(f"   Loss: Categorical Crossentropy")
     
@@ -131,7 +207,13 @@ def main():
         history, model = train_emotion_model(
             train_data_path=data_path,
             epochs=epochs,
-            batch_size=batch_size
+            batch_size=batch_size,
+            augment=args.augment,
+            shuffle_buffer=args.shuffle_buffer,
+            data_threads=args.data_threads,
+            data_intra_op=args.data_intra_op,
+            profile=args.profile,
+            cache_copies=args.cache_copies
         )
         
         print("\n" + "="*60)
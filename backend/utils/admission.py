@@ -0,0 +1,137 @@
+# Admission Control
+# utils/admission.py
+#
+# Per-endpoint concurrency limits with a bounded wait queue. When the queue
+# is full, or the expected wait would overrun the request's deadline, the
+# request is shed immediately (503 + Retry-After) instead of piling up.
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EndpointGate:
+    def __init__(self, name, max_concurrent, max_queue, max_wait=10.0, alpha=0.2):
+        self.name           = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue      = max(0, max_queue)
+        self.max_wait       = max_wait     # seconds a request may wait without a deadline
+        self.alpha          = alpha
+        self.active         = 0
+        self.waiting        = 0
+        self.service_ms     = None         # moving average of time holding a slot
+        self.admitted       = 0
+        self.shed           = {'queue_full': 0, 'deadline': 0, 'timeout': 0}
+        self._cond          = threading.Condition()
+
+    def _expected_wait_ms(self):
+        if self.active < self.max_concurrent or self.service_ms is None:
+            return 0.0
+        return math.ceil((self.waiting + 1) / self.max_concurrent) * self.service_ms
+
+    def _reject(self, reason, message, wait_ms):
+        self.shed[reason] += 1
+        raise Overloaded(message, retry_after=max(1, math.ceil(wait_ms / 1000)))
+
+    def acquire(self, deadline_ms=None):
+        """
+        Take a slot, waiting in the bounded queue if needed. deadline_ms is
+        the time the caller has left; returns the start time for release().
+        """
+        with self._cond:
+            if self.active >= self.max_concurrent or self.waiting:
+                wait_ms = self._expected_wait_ms()
+                if self.waiting >= self.max_queue:
+                    self._reject('queue_full', f"{self.name} queue is full", wait_ms)
+                if deadline_ms is not None and wait_ms > deadline_ms:
+                    self._reject('deadline',
+                                 f"{self.name} expected wait {wait_ms:.0f} ms exceeds the deadline",
+                                 wait_ms)
+
+                timeout = self.max_wait if deadline_ms is None else max(0.0, deadline_ms / 1000)
+                self.waiting += 1
+                try:
+                    ok = self._cond.wait_for(lambda: self.active < self.max_concurrent, timeout)
+                finally:
+                    self.waiting -= 1
+                if not ok:
+                    self._reject('timeout', f"{self.name} timed out waiting for a slot",
+                                 self._expected_wait_ms())
+
+            self.active   += 1
+            self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started):
+        elapsed = 1000 * (time.monotonic() - started)
+        with self._cond:
+            self.active -= 1
+            self.service_ms = elapsed if self.service_ms is None else \
+                self.service_ms + self.alpha * (elapsed - self.service_ms)
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, deadline_ms=None):
+        started = self.acquire(deadline_ms)
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue'     : self.max_queue,
+                'active'        : self.active,
+                'queue_depth'   : self.waiting,
+                'admitted'      : self.admitted,
+                'shed'          : dict(self.shed),
+                'service_ms'    : None if self.service_ms is None else round(self.service_ms, 1),
+            }
+
+
+# ----------------------------------------------------------------------
+class AdmissionController:
+    """
+    One EndpointGate per endpoint name. Limits come from `limits`, e.g.
+    {'analyze-all': (2, 8)}, or the ADMISSION_LIMITS environment variable
+    ("analyze-all=2:8,detect-emotion=4:16"); other endpoints get the defaults.
+    """
+
+    def __init__(self, default_concurrent=None, default_queue=None, limits=None):
+        self.default_concurrent = default_concurrent or os.cpu_count() or 1
+        self.default_queue      = default_queue if default_queue is not None \
+            else 4 * self.default_concurrent
+        self.limits = dict(limits or parse_limits(os.environ.get('ADMISSION_LIMITS', '')))
+        self._gates = {}
+        self._lock  = threading.Lock()
+
+    def gate(self, name):
+        with self._lock:
+            if name not in self._gates:
+                conc, queue = self.limits.get(name, (self.default_concurrent, self.default_queue))
+                self._gates[name] = EndpointGate(name, conc, queue)
+            return self._gates[name]
+
+    def stats(self):
+        with self._lock:
+            gates = dict(self._gates)
+        return {name: gate.stats() for name, gate in gates.items()}
+
+
+def parse_limits(spec):
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        name, _, value = item.partition('=')
+        conc, _, queue = value.partition(':')
+        limits[name.strip()] = (int(conc), int(queue or 4 * int(conc)))
+    return limits
@@ -0,0 +1,58 @@
+# Annotation Renderer
+# utils/annotation.py
+#
+# Services describe their annotations as primitives (see `overlays()` on
+# each service); this module draws any number of them onto one buffer.
+#
+#   ('rect',   (x1, y1), (x2, y2), color, thickness)   thickness -1 = filled
+#   ('line',   (x1, y1), (x2, y2), color, thickness)
+#   ('circle', (cx, cy), radius,   color, thickness)
+#   ('text',   text,     (x, y),   font_scale, color, thickness)
+
+import cv2
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def draw_overlays(canvas, overlays, scale=1.0):
+    """Draw primitives in place, scaling coordinates and sizes by `scale`."""
+    def pt(p):
+        return (int(round(p[0] * scale)), int(round(p[1] * scale)))
+
+    def thick(t):
+        return t if t < 0 else max(1, int(round(t * scale)))
+
+    for kind, *args in overlays:
+        if kind == 'rect':
+            p1, p2, color, t = args
+            cv2.rectangle(canvas, pt(p1), pt(p2), color, thick(t))
+        elif kind == 'line':
+            p1, p2, color, t = args
+            cv2.line(canvas, pt(p1), pt(p2), color, thick(t))
+        elif kind == 'circle':
+            center, radius, color, t = args
+            cv2.circle(canvas, pt(center), max(1, int(round(radius * scale))), color, thick(t))
+        elif kind == 'text':
+            text, org, font_scale, color, t = args
+            cv2.putText(canvas, text, pt(org), FONT, font_scale * scale, color, thick(t))
+    return canvas
+
+
+def render_overlays(image, overlays, output_width=None, copy=True):
+    """
+    Draw overlays from one or more services in a single pass onto one buffer.
+
+    If output_width is smaller than the image, the frame is downscaled first
+    (that resize is the only new buffer) and the primitives are scaled to
+    match. Otherwise the image is copied once, or drawn on directly when
+    copy=False.
+    """
+    h, w = image.shape[:2]
+    if output_width and output_width < w:
+        scale  = output_width / w
+        canvas = cv2.resize(image, (output_width, max(1, int(round(h * scale)))),
+                            interpolation=cv2.INTER_AREA)
+    else:
+        scale  = 1.0
+        canvas = image.copy() if copy else image
+    return draw_overlays(canvas, overlays, scale)
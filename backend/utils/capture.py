@@ -0,0 +1,83 @@
+# Request Capture
+# utils/capture.py
+#
+# Records a sample of live API traffic so it can be replayed by loadtest.py:
+# one JSON line per request (path, query, payload kind, status, latency)
+# in <dir>/requests.jsonl, and the image payloads themselves under
+# <dir>/payloads/<sha1>, stored once per distinct content.
+
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+
+class RequestCapture:
+    def __init__(self, directory, sample=1.0):
+        self.directory   = directory
+        self.sample      = sample
+        self.payload_dir = os.path.join(directory, 'payloads')
+        self.log_path    = os.path.join(directory, 'requests.jsonl')
+        self.captured    = 0
+        self._lock       = threading.Lock()
+        os.makedirs(self.payload_dir, exist_ok=True)
+
+    def sampled(self):
+        return self.sample >= 1 or random.random() < self.sample
+
+    def save_payload(self, stream):
+        """Copy a seekable stream into the payload store; returns its sha1 and rewinds it."""
+        start  = stream.tell()
+        digest = hashlib.sha1()
+        with tempfile.NamedTemporaryFile(dir=self.payload_dir, delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(256 * 1024), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        stream.seek(start)
+        name = digest.hexdigest()
+        path = os.path.join(self.payload_dir, name)
+        if os.path.exists(path):
+            os.unlink(tmp.name)
+        else:
+            os.replace(tmp.name, path)
+        return name
+
+    def save_bytes(self, data):
+        name = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.payload_dir, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return name
+
+    def record(self, entry):
+        entry.setdefault('t', round(time.time(), 3))
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line)
+            self.captured += 1
+
+    def stats(self):
+        return {'directory': self.directory, 'sample': self.sample, 'captured': self.captured}
+
+
+def load_capture(directory):
+    """Read a capture back as a list of entries, each with its payload bytes (or None)."""
+    payloads = {}
+    entries  = []
+    with open(os.path.join(directory, 'requests.jsonl')) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            name  = entry.get('payload')
+            if name and name not in payloads:
+                with open(os.path.join(directory, 'payloads', name), 'rb') as p:
+                    payloads[name] = p.read()
+            entry['body'] = payloads.get(name)
+            entries.append(entry)
+    return entries
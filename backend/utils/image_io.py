@@ -0,0 +1,91 @@
+# Image Decoding Helpers
+# utils/image_io.py
+
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Images above MAX_IMAGE_PIXELS are rejected from their header alone;
+# images with a side above MAX_IMAGE_SIDE are downscaled while decoding.
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+MAX_IMAGE_SIDE   = int(os.environ.get('MAX_IMAGE_SIDE', 4096))
+
+# No encoded image within the pixel limit needs more than 4 bytes per pixel
+MAX_ENCODED_BYTES = 4 * MAX_IMAGE_PIXELS
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds a size, pixel or memory limit."""
+
+
+class InvalidImage(ValueError):
+    """Raised when the uploaded image data is malformed."""
+
+
+def is_image_name(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def read_zip_member(zf, info, max_bytes=MAX_ENCODED_BYTES):
+    """
+    Read one image from a zip archive, refusing members that decompress to
+    more than max_bytes. The declared size is checked first, and the read is
+    bounded in case the header understates it.
+    """
+    if info.file_size > max_bytes:
+        raise UploadTooLarge(f"{info.filename} unpacks to {info.file_size} bytes, "
+                             f"over the limit of {max_bytes} bytes")
+    with zf.open(info) as f:
+        data = f.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLarge(f"{info.filename} unpacks to more than {max_bytes} bytes")
+    return data
+
+
+def open_image(data, max_side=MAX_IMAGE_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Open an image lazily (only the header is read) and check its dimensions.
+    Over-limit images are rejected before any pixel data is decoded; large
+    JPEGs are set up to decode directly at a reduced scale.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = io.BytesIO(data)
+    img = Image.open(data)
+    w, h = img.size
+    if w * h > max_pixels:
+        img.close()
+        raise UploadTooLarge(f"Image is {w}x{h} pixels, over the limit of {max_pixels} pixels")
+    if max_side and max(w, h) > max_side:
+        scale = max_side / max(w, h)
+        img.draft(img.mode, (max(1, int(w * scale)), max(1, int(h * scale))))
+    return img
+
+
+def decode_image(data, budget=None, max_side=MAX_IMAGE_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode encoded image bytes or a file-like object into a BGR (or gray) array.
+    If a RequestBudget is given, the decoded size is charged to it first.
+    """
+    img = open_image(data, max_side, max_pixels)
+    try:
+        if budget is not None:
+            # Charged from the header size, before any pixels are decoded. draft()
+            # already shrank JPEGs; other formats decode at full size before
+            # thumbnail() scales them, and the numpy copy is alive at the same time.
+            w, h  = img.size
+            scale = min(1.0, max_side / max(w, h)) if max_side else 1.0
+            final = max(1, int(w * scale)) * max(1, int(h * scale))
+            budget.charge((w * h + final) * len(img.getbands()), 'Decoded image')
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side))
+        arr = np.array(img)
+    finally:
+        img.close()
+
+    if arr.ndim == 3 and arr.shape[2] == 3:
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR, dst=arr)
+    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if arr.ndim == 3 else arr
@@ -0,0 +1,199 @@
+# Memory Instrumentation
+# utils/memory.py
+#
+# RSS and Python-heap gauges, tracemalloc snapshots with a diff of the top
+# allocation sites between two of them, per-endpoint allocation deltas on a
+# sampled fraction of requests, and an RSS threshold past which a worker
+# asks to be recycled before the OOM killer gets to it.
+
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+MB = 1024 * 1024
+
+# Allocations made by the instrumentation itself
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'))
+
+
+def rss_bytes():
+    """Current resident set size; peak RSS where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _site(stat):
+    return ' <- '.join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+
+
+class MemoryMonitor:
+    """
+    `sample` is the fraction of requests whose allocation deltas are
+    recorded; a non-zero value turns tracemalloc on at startup (it slows
+    every allocation down, so keep it off or small in production).
+    Deltas of concurrent requests overlap, so treat them as indicative.
+
+    Tracing started on demand by snapshot() stops again (dropping the
+    snapshots) after `trace_idle` seconds without a new snapshot.
+    """
+
+    def __init__(self, sample=0.0, recycle_mb=None, frames=10, max_snapshots=8,
+                 trace_idle=600):
+        self.sample        = sample
+        self.recycle_bytes = recycle_mb * MB if recycle_mb else None
+        self.frames        = frames
+        self.max_snapshots = max_snapshots
+        self.trace_idle    = trace_idle
+        self.snapshots     = OrderedDict()   # name -> (taken_at, Snapshot)
+        self.endpoints     = {}
+        self.recycle_requested = False
+        self._auto_stop    = None
+        self._lock = threading.Lock()
+        if sample > 0:
+            self.start_tracing()
+
+    # ------------------------------------------------------------------
+    def start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop_tracing(self):
+        """
+        Drop the snapshots and stop tracemalloc, unless request sampling
+        needs it (then only the snapshots go). Returns whether tracing stopped.
+        """
+        stopped = self.sample <= 0
+        if stopped:
+            tracemalloc.stop()
+        with self._lock:
+            self.snapshots.clear()
+            if self._auto_stop is not None:
+                self._auto_stop.cancel()
+                self._auto_stop = None
+        return stopped
+
+    def _arm_auto_stop(self):
+        """(Re)start the idle timer for on-demand tracing; sampling keeps tracing on."""
+        if self.sample > 0 or not self.trace_idle:
+            return
+        with self._lock:
+            if self._auto_stop is not None:
+                self._auto_stop.cancel()
+            self._auto_stop = threading.Timer(self.trace_idle, self.stop_tracing)
+            self._auto_stop.daemon = True
+            self._auto_stop.start()
+
+    def gauges(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+        return {
+            'rss_mb'           : round(rss_bytes() / MB, 1),
+            'tracing'          : tracing,
+            'python_heap_mb'   : None if current is None else round(current / MB, 1),
+            'python_peak_mb'   : None if peak is None else round(peak / MB, 1),
+            'gc_counts'        : gc.get_count(),
+            'recycle_at_mb'    : self.recycle_bytes and round(self.recycle_bytes / MB),
+            'recycle_requested': self.recycle_requested,
+        }
+
+    # ------------------------------------------------------------------
+    def snapshot(self, name=None, limit=10):
+        """
+        Take and keep a tracemalloc snapshot. Tracing starts on the first
+        call if it is off, so only allocations made after that are seen.
+        """
+        self.start_tracing()
+        self._arm_auto_stop()
+        snap = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        with self._lock:
+            name = name or f"snap-{len(self.snapshots) + 1}-{int(time.time())}"
+            self.snapshots[name] = (time.time(), snap)
+            self.snapshots.move_to_end(name)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return {'name': name, 'rss_mb': round(rss_bytes() / MB, 1),
+                'top': self.top(name, limit)}
+
+    def has_snapshot(self, name):
+        with self._lock:
+            return name in self.snapshots
+
+    def _get(self, name):
+        with self._lock:
+            if name not in self.snapshots:
+                raise KeyError(f"No snapshot named '{name}'")
+            return self.snapshots[name][1]
+
+    def list_snapshots(self):
+        with self._lock:
+            return [{'name': n, 'taken_at': round(t, 3)} for n, (t, _) in self.snapshots.items()]
+
+    def top(self, name, limit=10, key='lineno'):
+        stats = self._get(name).statistics(key)
+        return [{'site': _site(s), 'size_kb': round(s.size / 1024, 1), 'count': s.count}
+                for s in stats[:limit]]
+
+    def diff(self, old, new, limit=20, key='lineno'):
+        """Top allocation sites by growth from snapshot `old` to snapshot `new`."""
+        stats = self._get(new).compare_to(self._get(old), key)
+        return [{
+            'site'        : _site(s),
+            'size_diff_kb': round(s.size_diff / 1024, 1),
+            'count_diff'  : s.count_diff,
+            'size_kb'     : round(s.size / 1024, 1),
+        } for s in stats[:limit]]
+
+    # ------------------------------------------------------------------
+    def begin(self):
+        """Token for end() if this request is sampled, else None."""
+        if self.sample <= 0 or random.random() >= self.sample:
+            return None
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        return traced, rss_bytes()
+
+    def end(self, endpoint, token):
+        traced, rss = token
+        alloc = tracemalloc.get_traced_memory()[0] - traced \
+            if traced is not None and tracemalloc.is_tracing() else 0
+        rss_delta = rss_bytes() - rss
+        with self._lock:
+            e = self.endpoints.setdefault(endpoint, {'samples': 0, 'alloc': 0, 'rss': 0,
+                                                     'max_alloc': 0})
+            e['samples']  += 1
+            e['alloc']    += alloc
+            e['rss']      += rss_delta
+            e['max_alloc'] = max(e['max_alloc'], alloc)
+
+    def endpoint_stats(self):
+        with self._lock:
+            return {name: {
+                'samples'          : e['samples'],
+                'avg_heap_delta_kb': round(e['alloc'] / e['samples'] / 1024, 1),
+                'max_heap_delta_kb': round(e['max_alloc'] / 1024, 1),
+                'avg_rss_delta_kb' : round(e['rss'] / e['samples'] / 1024, 1),
+            } for name, e in self.endpoints.items()}
+
+    def check_recycle(self):
+        """True once, when RSS first crosses the recycle threshold."""
+        if self.recycle_bytes is None or self.recycle_requested:
+            return False
+        if rss_bytes() > self.recycle_bytes:
+            self.recycle_requested = True
+            return True
+        return False
+
+    def stats(self):
+        return {**self.gauges(), 'endpoints': self.endpoint_stats(),
+                'snapshots': self.list_snapshots()}
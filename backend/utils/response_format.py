@@ -0,0 +1,137 @@
+# Response Formatting
+# utils/response_format.py
+#
+# Field selection and compact encodings for analysis results.
+#
+#   fields=bbox,probabilities   keep only these optional parts
+#   format=columnar             per-item lists become column arrays
+#   format=msgpack              MessagePack body (400 if msgpack is not installed)
+#   format=columnar,msgpack     both ('+' and ' ' work too; '+' arrives as a
+#                               space in a query string)
+
+import json
+import re
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Optional parts of a result; counts, labels and confidences are always kept
+OPTIONAL_FIELDS = {
+    'quote'          : 'quote on each face',
+    'probabilities'  : 'all_probabilities on each face',
+    'bbox'           : 'bbox on each face',
+    'message'        : 'counting message',
+    'hands'          : 'per-hand detail',
+    'objects'        : 'per-object detail',
+    'annotated_image': 'annotated image',
+}
+
+FORMATS = ('json', 'columnar', 'msgpack', 'columnar+msgpack')
+HAS_MSGPACK = msgpack is not None
+
+
+class InvalidFormat(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """
+    None means 'everything'; otherwise the set of optional fields to keep,
+    from a comma-separated string or a list of names.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    elif not isinstance(value, (list, tuple)) or not all(isinstance(f, str) for f in value):
+        raise InvalidFormat("fields must be a comma-separated string or a list of names")
+    fields = {f.strip() for f in value if f.strip() and f.strip() != 'none'}
+    unknown = fields - OPTIONAL_FIELDS.keys()
+    if unknown:
+        raise InvalidFormat(f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                            f"Choose from: {', '.join(OPTIONAL_FIELDS)}")
+    return fields
+
+
+def wants(fields, name):
+    return fields is None or name in fields
+
+
+def _sections(res):
+    """The service results inside a response (one, or several for analyze-all)."""
+    nested = [v for k, v in res.items() if k in ('emotion', 'fingers', 'objects') and isinstance(v, dict)]
+    return nested or [res]
+
+
+def select_fields(res, fields):
+    if fields is None:
+        return res
+    if 'annotated_image' not in fields:
+        res.pop('annotated_image', None)
+    for section in _sections(res):
+        if 'message' not in fields:
+            section.pop('message', None)
+        if 'hands' not in fields:
+            section.pop('hands', None)
+        if 'objects' not in fields and 'count' in section:
+            section.pop('objects', None)
+        for face in section.get('emotions', []):
+            for name, key in (('quote', 'quote'), ('probabilities', 'all_probabilities'),
+                              ('bbox', 'bbox')):
+                if name not in fields:
+                    face.pop(key, None)
+    return res
+
+
+# ----------------------------------------------------------------------
+def _compact_value(value):
+    if isinstance(value, dict):
+        return [_compact_value(v) for v in value.values()]
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def _columns(rows):
+    """Turn a list of dicts into a dict of lists; bbox/center/probability dicts become arrays."""
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, [])
+    for row in rows:
+        for key, col in columns.items():
+            col.append(_compact_value(row.get(key)))
+    return columns
+
+
+def to_columnar(res):
+    for section in _sections(res):
+        for key in ('emotions', 'hands', 'objects'):
+            if isinstance(section.get(key), list):
+                rows = section[key]
+                section[key] = _columns(rows)
+                if key == 'emotions' and rows and 'all_probabilities' in rows[0]:
+                    section['probability_labels'] = list(rows[0]['all_probabilities'])
+    return res
+
+
+def parse_format(value):
+    if value is not None and not isinstance(value, str):
+        raise InvalidFormat(f"Unknown format '{value}'. Choose from: {', '.join(FORMATS)}")
+    fmt = '+'.join(sorted(set(re.split(r'[+, ]+', value.strip())))) if value and value.strip() else 'json'
+    if fmt not in FORMATS:
+        raise InvalidFormat(f"Unknown format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+    if fmt.endswith('msgpack') and not HAS_MSGPACK:
+        raise InvalidFormat("format=msgpack needs the msgpack package, which is not installed")
+    return fmt
+
+
+def encode(res, fmt='json'):
+    """Return (body, mimetype) for the requested format."""
+    if fmt.startswith('columnar'):
+        res = to_columnar(res)
+    if fmt.endswith('msgpack'):
+        return msgpack.packb(res, use_bin_type=True), 'application/x-msgpack'
+    return json.dumps(res, separators=(',', ':')), 'application/json'
@@ -0,0 +1,78 @@
+# Thread Budgets
+# utils/thread_budget.py
+#
+# TensorFlow, OpenCV and MediaPipe each size their thread pools to the whole
+# machine, so several workers per box oversubscribe the cores. One budget
+# per worker process, read from the environment:
+#
+#   THREADS_PER_WORKER    threads for each library (default: cores / WEB_CONCURRENCY,
+#                         or the libraries' own defaults when neither is set)
+#   TF_INTRA_OP_THREADS   TensorFlow ops' internal parallelism
+#   TF_INTER_OP_THREADS   TensorFlow ops run concurrently (default min(2, budget))
+#   OPENCV_THREADS        cv2.setNumThreads
+#   MEDIAPIPE_THREADS     concurrent HandLandmarker instances per setting
+#                         (the Tasks API has no graph thread option)
+#
+# The serving processes (app.py, job and batch workers) apply it at startup
+# with configure_threads(); it takes effect once per process. Offline
+# training and evaluation keep the libraries' defaults.
+
+import os
+
+_applied = set()
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def thread_budget():
+    """Per-library thread counts for this process; None means library default."""
+    per_worker = _env_int('THREADS_PER_WORKER')
+    workers    = _env_int('WEB_CONCURRENCY')
+    if per_worker is None and workers:
+        per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    return {
+        'tf_intra_op': _env_int('TF_INTRA_OP_THREADS') or per_worker,
+        'tf_inter_op': _env_int('TF_INTER_OP_THREADS') or (per_worker and min(2, per_worker)),
+        'opencv'     : _env_int('OPENCV_THREADS') or per_worker,
+        'mediapipe'  : _env_int('MEDIAPIPE_THREADS') or per_worker,
+    }
+
+
+def configure_tensorflow():
+    """Set TensorFlow's pools; must run before TensorFlow executes its first op."""
+    budget = thread_budget()
+    if 'tensorflow' in _applied or not (budget['tf_intra_op'] or budget['tf_inter_op']):
+        return
+    _applied.add('tensorflow')
+    import tensorflow as tf
+    try:
+        if budget['tf_intra_op']:
+            tf.config.threading.set_intra_op_parallelism_threads(budget['tf_intra_op'])
+        if budget['tf_inter_op']:
+            tf.config.threading.set_inter_op_parallelism_threads(budget['tf_inter_op'])
+    except RuntimeError as e:
+        print(f"⚠️  TensorFlow thread budget not applied (runtime already started): {e}")
+
+
+def configure_opencv():
+    budget = thread_budget()
+    if 'opencv' in _applied or not budget['opencv']:
+        return
+    _applied.add('opencv')
+    import cv2
+    cv2.setNumThreads(budget['opencv'])
+
+
+def configure_threads():
+    """Apply the budget to TensorFlow and OpenCV, before any service is created."""
+    configure_tensorflow()
+    configure_opencv()
+
+
+def applied():
+    """The budget together with which libraries it has been applied to."""
+    return {**thread_budget(), 'applied': sorted(_applied), 'cpu_count': os.cpu_count()}
@@ -0,0 +1,113 @@
+# Upload Handling Helpers
+# utils/uploads.py
+#
+# Keeps upload memory bounded: multipart files and decoded base64 payloads
+# are spooled to disk past a small threshold, and every request charges
+# the bytes it holds in RAM to a per-request and a per-worker budget.
+
+import base64
+import binascii
+import shutil
+import tempfile
+import threading
+
+from flask import Request
+
+from utils.image_io import UploadTooLarge, InvalidImage
+
+MB = 1024 * 1024
+
+SPOOL_THRESHOLD = 1 * MB    # spooled files move to disk beyond this size
+
+# Request bodies that are the image itself
+RAW_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'application/octet-stream'}
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when the worker as a whole has no memory budget left."""
+
+
+class SpooledRequest(Request):
+    """Request class that spools multipart file parts to disk past SPOOL_THRESHOLD."""
+
+    max_form_memory_size = 1 * MB
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD, mode='rb+')
+
+
+def stream_to_spool(stream, chunk_size=256 * 1024):
+    """Copy a (non-seekable) request stream into a spooled temp file, chunk by chunk."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+    shutil.copyfileobj(stream, spool, chunk_size)
+    spool.seek(0)
+    return spool
+
+
+def b64_to_spool(b64, chunk_size=4 * MB):
+    """
+    Decode base64 (optionally a data URL) into a spooled temp file chunk by
+    chunk, so the decoded bytes never sit in memory as one extra full copy.
+    """
+    if not isinstance(b64, str):
+        raise InvalidImage("image must be a base64 string or data URL")
+    start = b64.find(',', 0, 256) + 1
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+    step  = chunk_size - chunk_size % 4
+    try:
+        for i in range(start, len(b64), step):
+            spool.write(base64.b64decode(b64[i:i + step]))
+    except (binascii.Error, ValueError):
+        # Chunks only line up for unbroken base64; fall back to one pass
+        spool.seek(0)
+        spool.truncate()
+        try:
+            spool.write(base64.b64decode(b64[start:]))
+        except (binascii.Error, ValueError):
+            raise InvalidImage("image is not valid base64") from None
+    spool.seek(0)
+    return spool
+
+
+# ----------------------------------------------------------------------
+class MemoryAccountant:
+    """Tracks bytes reserved by in-flight requests against a per-worker limit."""
+
+    def __init__(self, worker_limit):
+        self.worker_limit = worker_limit
+        self.in_use       = 0
+        self._lock        = threading.Lock()
+
+    def budget(self, limit):
+        return RequestBudget(self, limit)
+
+    def stats(self):
+        return {'in_use_mb': round(self.in_use / MB, 1),
+                'limit_mb' : round(self.worker_limit / MB, 1)}
+
+
+class RequestBudget:
+    def __init__(self, accountant, limit):
+        self.accountant = accountant
+        self.limit      = limit
+        self.used       = 0
+
+    def charge(self, nbytes, what='Request'):
+        if self.used + nbytes > self.limit:
+            raise UploadTooLarge(
+                f"{what} needs {nbytes / MB:.1f} MB, over the per-request limit of "
+                f"{self.limit / MB:.0f} MB"
+            )
+        acc = self.accountant
+        with acc._lock:
+            if acc.in_use + nbytes > acc.worker_limit:
+                raise MemoryBudgetExceeded("Server is busy with other large uploads, retry shortly")
+            acc.in_use += nbytes
+        self.used += nbytes
+
+    def release(self):
+        acc = self.accountant
+        with acc._lock:
+            acc.in_use -= self.used
+        self.used = 0
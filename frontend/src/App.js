@@ -89,9 +89,13 @@ export default function App() {
 
       let response;
       if (mode === 'camera') {
-        const img = webcamRef.current?.getScreenshot();
-        if (!img) throw new Error('Could not capture from camera');
-        response = await axios.post(endpoint, { image: img, annotate: true });
+        // Send the frame as a raw JPEG body; no data URL / base64 overhead
+        const canvas = webcamRef.current?.getCanvas();
+        const blob   = canvas && await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.92));
+        if (!blob) throw new Error('Could not capture from camera');
+        response = await axios.post(`${endpoint}?annotate=true`, blob, {
+          headers: { 'Content-Type': 'image/jpeg' }
+        });
       } else {
         if (!selectedFile) throw new Error('No file selected');
         const fd = new FormData();